@@ -0,0 +1,645 @@
+import os
+import json
+import asyncio
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import numpy as np
+from typing import Any
+from collections import OrderedDict
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+# Load env variables
+load_dotenv()
+
+# Logger configuration
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+# Log to console (dev only)
+if os.getenv('APP_ENV') == "development":
+    handler = logging.StreamHandler()
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+# Also log to a file
+file_handler = logging.FileHandler(os.getenv('FASTAPI_LOG_FILE', "fastapi_errors.log"))
+file_handler.setFormatter(formatter)
+logger.addHandler(file_handler)
+
+
+# ============================== Retriever registry ==============================
+
+class RetrieverRegistry:
+    """ Process-wide LRU registry of the retrievers built for each document """
+
+    def __init__(self, max_documents: int = 16, max_memory_bytes: int = 512 * 1024 * 1024):
+        self.max_documents      = max_documents
+        self.max_memory_bytes   = max_memory_bytes
+
+        self._entries           = OrderedDict()
+        self._lock              = threading.Lock()
+        self._memory_bytes      = 0
+
+        self.hits               = 0
+        self.misses             = 0
+        self.evictions          = 0
+
+    def get(self, document_id: str) -> dict[str, Any] | None:
+        """ Return the entry for a document and mark it as most recently used """
+
+        with self._lock:
+            entry = self._entries.get(document_id)
+
+            if entry is None:
+                self.misses += 1
+                logger.info(f"FASTAPI Caches - RetrieverRegistry.get() - Miss for document {document_id}")
+                return None
+
+            self._entries.move_to_end(document_id)
+            self.hits += 1
+            logger.info(f"FASTAPI Caches - RetrieverRegistry.get() - Hit for document {document_id}")
+            return entry
+
+    def put(self, document_id: str, entry: dict[str, Any], size_bytes: int = 0) -> None:
+        """ Register the entry for a document, evicting the least recently used ones if needed """
+
+        with self._lock:
+            if document_id in self._entries:
+                self._memory_bytes -= self._entries.pop(document_id)['size_bytes']
+
+            entry['size_bytes'] = size_bytes
+            self._entries[document_id] = entry
+            self._memory_bytes += size_bytes
+
+            # Always keep the newest entry, even if it alone exceeds the memory budget
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_documents or self._memory_bytes > self.max_memory_bytes
+            ):
+                evicted_id, evicted = self._entries.popitem(last = False)
+                self._memory_bytes -= evicted['size_bytes']
+                self.evictions += 1
+                logger.info(f"FASTAPI Caches - RetrieverRegistry.put() - Evicted document {evicted_id}")
+
+    def __contains__(self, document_id: str) -> bool:
+        """ Check for an entry without touching the counters or the LRU order """
+
+        with self._lock:
+            return document_id in self._entries
+
+    def invalidate(self, document_id: str) -> None:
+        """ Drop the entry for a document so that it is rebuilt on next use """
+
+        with self._lock:
+            entry = self._entries.pop(document_id, None)
+            if entry is not None:
+                self._memory_bytes -= entry['size_bytes']
+
+    def stats(self) -> dict[str, Any]:
+        """ Return the registry counters """
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'documents'     : len(self._entries),
+                'memory_bytes'  : self._memory_bytes,
+                'hits'          : self.hits,
+                'misses'        : self.misses,
+                'evictions'     : self.evictions,
+                'hit_rate'      : round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+# Shared registry for the whole process
+retriever_registry = RetrieverRegistry(
+    max_documents       = int(os.getenv("RETRIEVER_REGISTRY_MAX_DOCUMENTS", 16)),
+    max_memory_bytes    = int(os.getenv("RETRIEVER_REGISTRY_MAX_MEMORY_MB", 512)) * 1024 * 1024
+)
+
+
+# ============================== Embedding cache ==============================
+
+class EmbeddingCache:
+    """ On-disk cache of embeddings keyed by (model, sha256 of text), stored as float32 blobs """
+
+    def __init__(self, db_path: str, max_entries: int = 200000):
+        self.db_path        = db_path
+        self.max_entries    = max_entries
+
+        self._lock          = threading.Lock()
+        self._conn          = sqlite3.connect(db_path, check_same_thread = False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+        self.hits           = 0
+        self.misses         = 0
+        self.evictions      = 0
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        """ Build the cache key for a text embedded with a model """
+
+        return model + ":" + hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def mget(self, model: str, texts: list[str]) -> list[list[float] | None]:
+        """ Return the cached vectors for the texts, None where missing """
+
+        keys = [self.make_key(model, text) for text in texts]
+        found = {}
+
+        with self._lock:
+            # Stay well under SQLite's bound parameter limit
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(time.time(), key) for key in found]
+                )
+                self._conn.commit()
+
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+
+        return [
+            np.frombuffer(found[key], dtype = np.float32).tolist() if key in found else None
+            for key in keys
+        ]
+
+    def mset(self, model: str, items: list[tuple[str, list[float]]]) -> None:
+        """ Store vectors for the texts and evict the least recently used entries over the limit """
+
+        now = time.time()
+        rows = [
+            (self.make_key(model, text), np.asarray(vector, dtype = np.float32).tobytes(), now)
+            for text, vector in items
+        ]
+
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if count > self.max_entries:
+                # Trim a little below the limit so eviction does not run on every insert
+                excess = count - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self.evictions += excess
+                logger.info(f"FASTAPI Caches - EmbeddingCache.mset() - Evicted {excess} embeddings")
+
+            self._conn.commit()
+
+    def stats(self) -> dict[str, Any]:
+        """ Return the cache counters """
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return {
+                'entries'   : entries,
+                'hits'      : self.hits,
+                'misses'    : self.misses,
+                'evictions' : self.evictions,
+                'hit_rate'  : round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+class LRUCache:
+    """ Thread-safe in-process LRU mapping with hit/miss counters """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries    = max_entries
+
+        self._entries       = OrderedDict()
+        self._lock          = threading.Lock()
+
+        self.hits           = 0
+        self.misses         = 0
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last = False)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries'   : len(self._entries),
+                'hits'      : self.hits,
+                'misses'    : self.misses,
+                'hit_rate'  : round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+def normalize_question(text: str) -> str:
+    """ Normalize a question so that trivial rephrasings share a cache key """
+
+    return " ".join(text.lower().split()).rstrip(" ?!.")
+
+
+class CachedEmbeddings(Embeddings):
+    """ Embeddings wrapper that only calls the provider for texts missing from the cache """
+
+    def __init__(self, underlying: Embeddings, model: str, cache: EmbeddingCache, query_cache: LRUCache | None = None):
+        self.underlying     = underlying
+        self.model          = model
+        self.cache          = cache
+        self.query_cache    = query_cache
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        vectors = self.cache.mget(self.model, texts)
+
+        # Embed each distinct missing text once
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+
+        if missing:
+            logger.info(f"FASTAPI Caches - CachedEmbeddings.embed_documents() - Embedding {len(missing)} uncached texts")
+            computed = dict(zip(missing, self.underlying.embed_documents(missing)))
+            self.cache.mset(self.model, list(computed.items()))
+            vectors = [computed[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+
+        return vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        
+        # Repeated questions are answered from memory without touching the disk cache
+        key = normalize_question(text)
+        if self.query_cache is not None:
+            vector = self.query_cache.get(key)
+            if vector is not None:
+                return vector
+
+        vector = self.cache.mget(self.model, [text])[0]
+
+        if vector is None:
+            vector = self.underlying.embed_query(text)
+            self.cache.mset(self.model, [(text, vector)])
+
+        if self.query_cache is not None:
+            self.query_cache.put(key, vector)
+
+        return vector
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+
+        # SQLite calls run on a worker thread, off the event loop
+        vectors = await asyncio.to_thread(self.cache.mget, self.model, texts)
+
+        # Embed each distinct missing text once
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+
+        if missing:
+            logger.info(f"FASTAPI Caches - CachedEmbeddings.aembed_documents() - Embedding {len(missing)} uncached texts")
+            computed = dict(zip(missing, await self.underlying.aembed_documents(missing)))
+            await asyncio.to_thread(self.cache.mset, self.model, list(computed.items()))
+            vectors = [computed[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+
+        return vectors
+
+    async def aembed_query(self, text: str) -> list[float]:
+
+        # Repeated questions are answered from memory without touching the disk cache
+        key = normalize_question(text)
+        if self.query_cache is not None:
+            vector = self.query_cache.get(key)
+            if vector is not None:
+                return vector
+
+        vector = (await asyncio.to_thread(self.cache.mget, self.model, [text]))[0]
+
+        if vector is None:
+            vector = await self.underlying.aembed_query(text)
+            await asyncio.to_thread(self.cache.mset, self.model, [(text, vector)])
+
+        if self.query_cache is not None:
+            self.query_cache.put(key, vector)
+
+        return vector
+
+
+# Shared embedding cache for the whole process
+embedding_cache = EmbeddingCache(
+    db_path     = os.getenv("EMBEDDING_CACHE_FILE", "embedding_cache.db"),
+    max_entries = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 200000))
+)
+
+# Shared question embedding LRU for the whole process
+query_embedding_cache = LRUCache(
+    max_entries = int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_ENTRIES", 2048))
+)
+
+
+# ============================== Answer cache ==============================
+
+class AnswerCache:
+    """ Persistent exact-match cache of chatbot answers with a TTL and per-document invalidation """
+
+    def __init__(self, db_path: str, ttl_seconds: int = 86400):
+        self.db_path        = db_path
+        self.ttl_seconds    = ttl_seconds
+
+        self._lock          = threading.Lock()
+        self._conn          = sqlite3.connect(db_path, check_same_thread = False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, document_id TEXT NOT NULL, answer TEXT NOT NULL, created_at REAL NOT NULL, source TEXT)"
+        )
+
+        # Databases created before answers recorded their source gain the column, their rows keep NULL
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(answers)")]
+        if "source" not in columns:
+            self._conn.execute("ALTER TABLE answers ADD COLUMN source TEXT")
+
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_document_id ON answers (document_id)")
+        self._conn.commit()
+
+        self.hits           = 0
+        self.misses         = 0
+
+    @staticmethod
+    def make_key(document_id: str, question: str, prompt_type: str, source: str) -> str:
+        """ Build the cache key from the normalized request tuple """
+
+        # Enum members are keyed by their value
+        parts = [document_id, normalize_question(question), getattr(prompt_type, "value", prompt_type), getattr(source, "value", source)]
+        return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+    def get(self, document_id: str, question: str, prompt_type: str, source: str) -> dict[str, Any] | None:
+        """ Return the cached answer for the request, None if missing or expired """
+
+        key = self.make_key(document_id, question, prompt_type, source)
+
+        with self._lock:
+            row = self._conn.execute("SELECT answer, created_at FROM answers WHERE key = ?", (key,)).fetchone()
+
+            if row is None or time.time() - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, document_id: str, question: str, prompt_type: str, source: str, answer: dict[str, Any]) -> None:
+        """ Store the answer for the request """
+
+        key = self.make_key(document_id, question, prompt_type, source)
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, document_id, answer, created_at, source) VALUES (?, ?, ?, ?, ?)",
+                (key, document_id, json.dumps(answer), time.time(), getattr(source, "value", source))
+            )
+            self._conn.commit()
+
+    def invalidate(self, document_id: str, source: str | None = None) -> None:
+        """ Drop the answers of a document, only those drawn from one source when given """
+
+        with self._lock:
+            if source is None:
+                self._conn.execute("DELETE FROM answers WHERE document_id = ?", (document_id,))
+            
+            # Answers cached before the source was recorded may come from it too
+            else:
+                self._conn.execute(
+                    "DELETE FROM answers WHERE document_id = ? AND (source = ? OR source IS NULL)",
+                    (document_id, getattr(source, "value", source))
+                )
+            self._conn.commit()
+
+        logger.info(f"FASTAPI Caches - AnswerCache.invalidate() - Dropped cached {source or 'all'} answers for document {document_id}")
+
+    def stats(self) -> dict[str, Any]:
+        """ Return the cache counters """
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            entries = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            return {
+                'entries'   : entries,
+                'hits'      : self.hits,
+                'misses'    : self.misses,
+                'hit_rate'  : round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+class SemanticAnswerCache:
+    """ Per-document cache of past question vectors and answers, matched by cosine similarity """
+
+    def __init__(self, db_path: str, threshold: float = 0.92, ttl_seconds: int = 86400, max_entries_per_document: int = 500):
+        self.db_path                    = db_path
+        self.threshold                  = threshold
+        self.ttl_seconds                = ttl_seconds
+        self.max_entries_per_document   = max_entries_per_document
+
+        self._lock                      = threading.Lock()
+        self._conn                      = sqlite3.connect(db_path, check_same_thread = False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS semantic_answers (id INTEGER PRIMARY KEY AUTOINCREMENT, document_id TEXT NOT NULL, "
+            "prompt_type TEXT NOT NULL, source TEXT NOT NULL, question TEXT NOT NULL, vector BLOB NOT NULL, "
+            "answer TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS semantic_answers_scope ON semantic_answers (document_id, prompt_type, source)"
+        )
+        self._conn.commit()
+
+        # (document_id, prompt_type, source) -> (row ids, unit-normalized question matrix)
+        self._matrices                  = {}
+
+        self.hits                       = 0
+        self.misses                     = 0
+
+    @staticmethod
+    def make_scope(document_id: str, prompt_type: str, source: str) -> tuple[str, str, str]:
+        return (document_id, getattr(prompt_type, "value", prompt_type), getattr(source, "value", source))
+
+    def _load_matrix(self, scope: tuple[str, str, str]) -> tuple[list[int], np.ndarray]:
+        """ Load the question vectors of a scope from disk, once per process """
+
+        if scope not in self._matrices:
+            rows = self._conn.execute(
+                "SELECT id, vector FROM semantic_answers WHERE document_id = ? AND prompt_type = ? AND source = ? AND created_at > ? ORDER BY id",
+                (*scope, time.time() - self.ttl_seconds)
+            ).fetchall()
+
+            ids = [row[0] for row in rows]
+            matrix = np.vstack([np.frombuffer(row[1], dtype = np.float32) for row in rows]) if rows else np.empty((0, 0), dtype = np.float32)
+            self._matrices[scope] = (ids, matrix)
+
+        return self._matrices[scope]
+
+    def lookup(self, document_id: str, prompt_type: str, source: str, vector: list[float]) -> tuple[dict[str, Any] | None, float | None, str | None]:
+        """ Return the best cached answer above the threshold, with its similarity and question """
+
+        scope = self.make_scope(document_id, prompt_type, source)
+        query = np.asarray(vector, dtype = np.float32)
+        query /= (np.linalg.norm(query) or 1.0)
+
+        with self._lock:
+            ids, matrix = self._load_matrix(scope)
+
+            if not ids:
+                self.misses += 1
+                return None, None, None
+
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+
+            row = self._conn.execute(
+                "SELECT question, answer, created_at FROM semantic_answers WHERE id = ?", (ids[best],)
+            ).fetchone()
+
+            if row is None or similarity < self.threshold or time.time() - row[2] > self.ttl_seconds:
+                self.misses += 1
+                return None, similarity, row[0] if row else None
+
+            self.hits += 1
+            return json.loads(row[1]), similarity, row[0]
+
+    def put(self, document_id: str, prompt_type: str, source: str, question: str, vector: list[float], answer: dict[str, Any]) -> None:
+        """ Store a question vector with its answer, keeping the newest entries of the scope """
+
+        scope = self.make_scope(document_id, prompt_type, source)
+        unit = np.asarray(vector, dtype = np.float32)
+        unit /= (np.linalg.norm(unit) or 1.0)
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO semantic_answers (document_id, prompt_type, source, question, vector, answer, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (*scope, question, unit.tobytes(), json.dumps(answer), time.time())
+            )
+            self._conn.execute(
+                "DELETE FROM semantic_answers WHERE document_id = ? AND prompt_type = ? AND source = ? AND id NOT IN "
+                "(SELECT id FROM semantic_answers WHERE document_id = ? AND prompt_type = ? AND source = ? ORDER BY id DESC LIMIT ?)",
+                (*scope, *scope, self.max_entries_per_document)
+            )
+            self._conn.commit()
+
+            # Reload the scope on next lookup
+            self._matrices.pop(scope, None)
+
+    def invalidate(self, document_id: str, source: str | None = None) -> None:
+        """ Drop the answers of a document, only those drawn from one source when given """
+
+        source = getattr(source, "value", source)
+
+        with self._lock:
+            if source is None:
+                self._conn.execute("DELETE FROM semantic_answers WHERE document_id = ?", (document_id,))
+            else:
+                self._conn.execute("DELETE FROM semantic_answers WHERE document_id = ? AND source = ?", (document_id, source))
+            self._conn.commit()
+
+            for scope in [scope for scope in self._matrices if scope[0] == document_id and source in (None, scope[2])]:
+                del self._matrices[scope]
+
+    def stats(self) -> dict[str, Any]:
+        """ Return the cache counters """
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            entries = self._conn.execute("SELECT COUNT(*) FROM semantic_answers").fetchone()[0]
+            return {
+                'entries'   : entries,
+                'threshold' : self.threshold,
+                'hits'      : self.hits,
+                'misses'    : self.misses,
+                'hit_rate'  : round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+class TrustScoreStore:
+    """ Status of the background trust scoring jobs, shared by every worker process through SQLite """
+
+    def __init__(self, db_path: str, max_entries: int = 10000):
+        self.db_path        = db_path
+        self.max_entries    = max_entries
+
+        self._lock          = threading.Lock()
+        self._conn          = sqlite3.connect(db_path, check_same_thread = False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS trust_scores (score_id TEXT PRIMARY KEY, document_id TEXT NOT NULL, "
+            "status TEXT NOT NULL, trust_score TEXT, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, score_id: str) -> dict[str, Any] | None:
+        """ Return the status of a scoring job, None if unknown """
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, document_id, trust_score FROM trust_scores WHERE score_id = ?", (score_id,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return {
+            "status"        : row[0],
+            "document_id"   : row[1],
+            "trust_score"   : row[2]
+        }
+
+    def put(self, score_id: str, document_id: str, status: str, trust_score: str | None = None) -> None:
+        """ Record the status of a scoring job, keeping the newest entries """
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO trust_scores VALUES (?, ?, ?, ?, ?)",
+                (score_id, document_id, status, trust_score, time.time())
+            )
+            self._conn.execute(
+                "DELETE FROM trust_scores WHERE rowid <= (SELECT MAX(rowid) FROM trust_scores) - ?",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+
+# Shared answer cache for the whole process
+answer_cache = AnswerCache(
+    db_path     = os.getenv("ANSWER_CACHE_FILE", "answer_cache.db"),
+    ttl_seconds = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", 86400))
+)
+
+# Shared semantic answer cache, stored alongside the exact-match answers
+semantic_answer_cache = SemanticAnswerCache(
+    db_path                     = os.getenv("ANSWER_CACHE_FILE", "answer_cache.db"),
+    threshold                   = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92)),
+    ttl_seconds                 = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", 86400)),
+    max_entries_per_document    = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES_PER_DOCUMENT", 500))
+)
+
+# Trust scores of background scoring jobs, stored alongside the answers
+trust_score_store = TrustScoreStore(
+    db_path     = os.getenv("ANSWER_CACHE_FILE", "answer_cache.db"),
+    max_entries = int(os.getenv("TRUST_SCORE_MAX_RESULTS", 10000))
+)
@@ -0,0 +1,190 @@
+import os
+import re
+import logging
+import numpy as np
+from PIL import Image
+from typing import Any
+from collections import defaultdict
+from dotenv import load_dotenv
+
+# Load env variables
+load_dotenv()
+
+# Logger configuration
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+# Log to console (dev only)
+if os.getenv('APP_ENV') == "development":
+    handler = logging.StreamHandler()
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+# Also log to a file
+file_handler = logging.FileHandler(os.getenv('FASTAPI_LOG_FILE', "fastapi_errors.log"))
+file_handler.setFormatter(formatter)
+logger.addHandler(file_handler)
+
+
+# Extracted images are named <figure|table>-<page>-<number>.jpg by unstructured
+PAGE_PATTERN = re.compile(r"-(\d+)-\d+\.\w+$")
+
+
+def grayscale_pixels(image: Image.Image, size: tuple[int, int]) -> np.ndarray:
+    """ Downscale the image to grayscale pixels, averaging each area """
+
+    return np.asarray(image.convert("L").resize(size, Image.Resampling.BOX), dtype = np.float32)
+
+
+def color_entropy(image: Image.Image) -> float:
+    """ Shannon entropy, in bits, of the grayscale histogram """
+
+    histogram = np.bincount(grayscale_pixels(image, (64, 64)).astype(np.uint8).ravel(), minlength = 256)
+    probabilities = histogram[histogram > 0] / histogram.sum()
+
+    return float(-(probabilities * np.log2(probabilities)).sum())
+
+
+def fingerprint(image: Image.Image) -> bytes:
+    """ Average hash: which 8x8 areas are brighter than the mean, stable across re-encodings """
+
+    pixels = grayscale_pixels(image, (8, 8))
+    return np.packbits(pixels > pixels.mean()).tobytes()
+
+
+def screen_images(
+    path: str,
+    img_files: list[str],
+    min_width: int = 100,
+    min_height: int = 100,
+    max_aspect_ratio: float = 6.0,
+    min_bytes: int = 3072,
+    min_entropy: float = 1.0,
+    max_pages: int = 3
+) -> tuple[list[str], list[dict[str, Any]]]:
+    """ Drop logos, rules, blank crops and tiny images before captioning, returning the kept files and every decision """
+
+    decisions = []
+    pages_by_fingerprint = defaultdict(set)
+
+    for img_file in img_files:
+        img_path = os.path.join(path, img_file)
+        decision = {"file": img_file, "bytes": os.path.getsize(img_path), "reason": None}
+
+        try:
+            with Image.open(img_path) as image:
+                width, height = image.size
+                decision.update({
+                    "width"         : width,
+                    "height"        : height,
+                    "aspect_ratio"  : round(max(width, height) / max(1, min(width, height)), 2),
+                    "entropy"       : round(color_entropy(image), 3)
+                })
+                decision["fingerprint"] = fingerprint(image)
+
+        except Exception as e:
+            decision["reason"] = f"unreadable: {e}"
+            decisions.append(decision)
+            continue
+
+        if width < min_width or height < min_height:
+            decision["reason"] = "too small"
+        elif decision["aspect_ratio"] > max_aspect_ratio:
+            decision["reason"] = "extreme aspect ratio"
+        elif decision["bytes"] < min_bytes:
+            decision["reason"] = "too few bytes"
+        elif decision["entropy"] < min_entropy:
+            decision["reason"] = "flat colors"
+
+        match = PAGE_PATTERN.search(img_file)
+        pages_by_fingerprint[decision["fingerprint"]].add(match.group(1) if match else img_file)
+        decisions.append(decision)
+
+    # Pictures repeated on many pages are logos and running headers
+    for decision in decisions:
+        if decision["reason"] is None and len(pages_by_fingerprint[decision["fingerprint"]]) > max_pages:
+            decision["reason"] = "repeated across pages"
+
+    kept = []
+    for decision in decisions:
+        decision.pop("fingerprint", None)
+        decision["kept"] = decision["reason"] is None
+
+        if decision["kept"]:
+            kept.append(decision["file"])
+            logger.info(f"FASTAPI Imaging - screen_images() - Kept {decision}")
+        else:
+            logger.info(f"FASTAPI Imaging - screen_images() - Dropped {decision}")
+
+    logger.info(f"FASTAPI Imaging - screen_images() - Kept {len(kept)} of {len(img_files)} images")
+
+    return kept, decisions
+
+
+def dct_matrix(size: int) -> np.ndarray:
+    """ Orthonormal DCT-II basis, so dct(x) = C @ x @ C.T """
+
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    basis = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2.0 / size)
+    basis[0] /= np.sqrt(2.0)
+
+    return basis
+
+
+DCT_32 = dct_matrix(32)
+
+
+def dhash(image: Image.Image) -> np.ndarray:
+    """ Difference hash: 64 bits telling whether each pixel is brighter than its right neighbour """
+
+    pixels = grayscale_pixels(image, (9, 8))
+    return (pixels[:, 1:] > pixels[:, :-1]).ravel()
+
+
+def phash(image: Image.Image) -> np.ndarray:
+    """ Perceptual hash: 64 bits comparing the lowest DCT frequencies to their median """
+
+    frequencies = (DCT_32 @ grayscale_pixels(image, (32, 32)) @ DCT_32.T)[:8, :8].ravel()
+
+    # The DC term only carries the overall brightness
+    return frequencies > np.median(frequencies[1:])
+
+
+def deduplicate_images(path: str, img_files: list[str], max_distance: int = 6) -> tuple[list[str], dict[str, str]]:
+    """ Collapse near-identical images onto the first occurrence, returning the canonical files and each duplicate's canonical file """
+
+    canonical_files = []
+    duplicates = {}
+    hashed_files, dhashes, phashes = [], [], []
+
+    for img_file in img_files:
+        try:
+            with Image.open(os.path.join(path, img_file)) as image:
+                image_dhash, image_phash = dhash(image), phash(image)
+
+        except Exception as e:
+            logger.warning(f"FASTAPI Imaging - deduplicate_images() - Could not hash {img_file}: {e}")
+            canonical_files.append(img_file)
+            continue
+
+        # Both hashes must agree, which keeps similar-looking charts apart
+        if hashed_files:
+            dhash_distances = (np.asarray(dhashes) != image_dhash).sum(axis = 1)
+            phash_distances = (np.asarray(phashes) != image_phash).sum(axis = 1)
+            matches = np.flatnonzero((dhash_distances <= max_distance) & (phash_distances <= max_distance))
+
+            if matches.size:
+                duplicates[img_file] = hashed_files[matches[0]]
+                logger.info(f"FASTAPI Imaging - deduplicate_images() - {img_file} duplicates {duplicates[img_file]} (dhash distance {dhash_distances[matches[0]]}, phash distance {phash_distances[matches[0]]})")
+                continue
+
+        canonical_files.append(img_file)
+        hashed_files.append(img_file)
+        dhashes.append(image_dhash)
+        phashes.append(image_phash)
+
+    logger.info(f"FASTAPI Imaging - deduplicate_images() - {len(canonical_files)} canonical images, {len(duplicates)} duplicates")
+
+    return canonical_files, duplicates
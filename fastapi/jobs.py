@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Callable
+from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+
+# Load env variables
+load_dotenv()
+
+# Logger configuration
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+# Log to console (dev only)
+if os.getenv('APP_ENV') == "development":
+    handler = logging.StreamHandler()
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+# Also log to a file
+file_handler = logging.FileHandler(os.getenv('FASTAPI_LOG_FILE', "fastapi_errors.log"))
+file_handler.setFormatter(formatter)
+logger.addHandler(file_handler)
+
+
+# Ordered ingestion stages, used to report progress
+INGESTION_STAGES = [
+    "downloading",
+    "partitioning",
+    "summarizing",
+    "captioning",
+    "saving",
+    "indexing"
+]
+
+
+class IngestionQueueFull(Exception):
+    """ Raised when the ingestion queue has no room for another document """
+
+
+class IngestionJobQueue:
+    """ Bounded worker pool running one ingestion job per document, with job status shared by every worker process through SQLite """
+
+    def __init__(self, db_path: str, max_workers: int = 2, max_queue_depth: int = 16):
+        self.db_path            = db_path
+        self.max_workers        = max_workers
+        self.max_queue_depth    = max_queue_depth
+
+        self._executor          = ThreadPoolExecutor(max_workers = max_workers, thread_name_prefix = "ingestion")
+        self._lock              = threading.Lock()
+
+        # Jobs run by this process, every change is written through to the shared table
+        self._jobs              = {}
+
+        self._conn              = sqlite3.connect(db_path, check_same_thread = False, isolation_level = None, timeout = 30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingestion_jobs (document_id TEXT PRIMARY KEY, pid INTEGER NOT NULL, status TEXT NOT NULL, job TEXT NOT NULL)"
+        )
+
+    @staticmethod
+    def _is_alive(pid: int) -> bool:
+        """ Whether the worker process owning a job is still running on this host """
+
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+
+        return True
+
+    def _load(self, document_id: str) -> dict[str, Any] | None:
+        """ Read the job of a document, failing pending jobs whose worker process exited """
+
+        row = self._conn.execute("SELECT pid, job FROM ingestion_jobs WHERE document_id = ?", (document_id,)).fetchone()
+        if row is None:
+            return None
+
+        job = json.loads(row[1])
+        if job['status'] in ("queued", "running") and not self._is_alive(row[0]):
+            job['status'] = "failed"
+            job['error'] = "The worker process running the job exited"
+
+        return job
+
+    def _save(self, job: dict[str, Any]) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO ingestion_jobs VALUES (?, ?, ?, ?)",
+            (job['document_id'], os.getpid(), job['status'], json.dumps(job))
+        )
+
+    def submit(self, document_id: str, fn: Callable[[str, Callable[..., None]], Any]) -> dict[str, Any]:
+        """ Queue fn(document_id, report_stage) unless a job for the document is already pending on any worker """
+
+        with self._lock:
+            # The check and the insert are one transaction, so two workers never queue the same document
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                job = self._load(document_id)
+
+                if job is not None and job['status'] in ("queued", "running"):
+                    self._conn.execute("COMMIT")
+                    return job
+
+                queued = sum(
+                    1 for (pid,) in self._conn.execute("SELECT pid FROM ingestion_jobs WHERE status = 'queued'").fetchall()
+                    if self._is_alive(pid)
+                )
+                if queued >= self.max_queue_depth:
+                    raise IngestionQueueFull(document_id)
+
+                job = {
+                    'document_id'   : document_id,
+                    'status'        : "queued",
+                    'stage'         : None,
+                    'progress'      : 0.0,
+                    'stages'        : [],
+                    'submitted_at'  : time.time(),
+                    'started_at'    : None,
+                    'finished_at'   : None,
+                    'error'         : None
+                }
+                self._jobs[document_id] = job
+                self._save(job)
+
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+            self._conn.execute("COMMIT")
+
+        logger.info(f"FASTAPI Jobs - IngestionJobQueue.submit() - Queued ingestion for document {document_id}")
+        self._executor.submit(self._run, document_id, fn)
+        return dict(job)
+
+    def _run(self, document_id: str, fn: Callable[[str, Callable[..., None]], Any]) -> None:
+        with self._lock:
+            job = self._jobs[document_id]
+            job['status'] = "running"
+            job['started_at'] = time.time()
+            self._save(job)
+
+        try:
+            fn(document_id, lambda stage, details = None: self.report_stage(document_id, stage, details))
+
+            with self._lock:
+                self._close_stage(job)
+                job['status'] = "complete"
+                job['progress'] = 1.0
+
+            logger.info(f"FASTAPI Jobs - IngestionJobQueue._run() - Ingestion complete for document {document_id}")
+
+        except Exception as e:
+            logger.error(f"FASTAPI Jobs Error - IngestionJobQueue._run() encountered an error: {e}")
+
+            with self._lock:
+                self._close_stage(job)
+                job['status'] = "failed"
+                job['error'] = str(e)
+
+        finally:
+            with self._lock:
+                job['finished_at'] = time.time()
+                self._save(job)
+                self._jobs.pop(document_id, None)
+
+    @staticmethod
+    def _close_stage(job: dict[str, Any]) -> None:
+        """ Record the duration of the stage in progress """
+
+        if job['stages'] and job['stages'][-1]['seconds'] is None:
+            job['stages'][-1]['seconds'] = round(time.time() - job['stages'][-1]['started_at'], 3)
+
+    def report_stage(self, document_id: str, stage: str, details: dict[str, Any] | None = None) -> None:
+        """ Move a running job to the given stage, or attach details to the stage in progress """
+
+        with self._lock:
+            job = self._jobs.get(document_id)
+            if job is None:
+                return
+
+            if details is not None and job['stage'] == stage:
+                job['stages'][-1].setdefault('details', {}).update(details)
+                self._save(job)
+                return
+
+            self._close_stage(job)
+            job['stages'].append({'name': stage, 'started_at': time.time(), 'seconds': None})
+            if details is not None:
+                job['stages'][-1]['details'] = dict(details)
+            job['stage'] = stage
+
+            if stage in INGESTION_STAGES:
+                job['progress'] = round(INGESTION_STAGES.index(stage) / len(INGESTION_STAGES), 3)
+
+            self._save(job)
+
+        logger.info(f"FASTAPI Jobs - IngestionJobQueue.report_stage() - Document {document_id} entered stage {stage}")
+
+    def get(self, document_id: str) -> dict[str, Any] | None:
+        """ Return a snapshot of the job of a document, whichever worker runs it """
+
+        with self._lock:
+            return self._load(document_id)
+
+    def is_pending(self, document_id: str) -> bool:
+        """ Whether a job for the document is queued or running on any worker """
+
+        job = self.get(document_id)
+        return job is not None and job['status'] in ("queued", "running")
+
+
+# Shared ingestion queue, its job status is visible to every worker process
+ingestion_jobs = IngestionJobQueue(
+    db_path         = os.getenv("INGESTION_JOBS_FILE", "ingestion_jobs.db"),
+    max_workers     = int(os.getenv("INGESTION_WORKERS", 2)),
+    max_queue_depth = int(os.getenv("INGESTION_MAX_QUEUE_DEPTH", 16))
+)
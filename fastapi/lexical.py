@@ -0,0 +1,275 @@
+import os
+import re
+import logging
+import numpy as np
+from typing import Any
+from collections import Counter
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun, AsyncCallbackManagerForRetrieverRun
+
+# Load env variables
+load_dotenv()
+
+# Logger configuration
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+# Log to console (dev only)
+if os.getenv('APP_ENV') == "development":
+    handler = logging.StreamHandler()
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+# Also log to a file
+file_handler = logging.FileHandler(os.getenv('FASTAPI_LOG_FILE', "fastapi_errors.log"))
+file_handler.setFormatter(formatter)
+logger.addHandler(file_handler)
+
+
+# Words too common to help ranking
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "in", "is", "it",
+    "of", "on", "or", "that", "the", "this", "to", "was", "were", "with"
+}
+
+
+def tokenize(text: str) -> list[str]:
+    """ Lowercase word tokens, keeping numbers and tickers intact """
+
+    return [token for token in re.findall(r"[a-z0-9]+", text.lower()) if token not in STOPWORDS]
+
+
+# ============================== BM25 index ==============================
+
+class BM25Index:
+    """ Compact BM25 inverted index: postings are stored as CSR-style NumPy arrays """
+
+    def __init__(self, doc_ids, vocabulary, indptr, postings, frequencies, doc_lengths, k1: float = 1.5, b: float = 0.75):
+        self.doc_ids        = np.asarray(doc_ids)
+        self.vocabulary     = np.asarray(vocabulary)
+        self.indptr         = np.asarray(indptr, dtype = np.int64)
+        self.postings       = np.asarray(postings, dtype = np.int32)
+        self.frequencies    = np.asarray(frequencies, dtype = np.float32)
+        self.doc_lengths    = np.asarray(doc_lengths, dtype = np.float32)
+        self.k1             = k1
+        self.b              = b
+
+        self.term_index     = {term: i for i, term in enumerate(self.vocabulary.tolist())}
+
+        # Okapi BM25 idf, kept positive for terms present in most documents
+        document_count      = len(self.doc_ids)
+        document_frequency  = np.diff(self.indptr).astype(np.float32)
+        self.idf            = np.log(1.0 + (document_count - document_frequency + 0.5) / (document_frequency + 0.5))
+        self.average_length = float(self.doc_lengths.mean()) if document_count else 0.0
+
+    @classmethod
+    def build(cls, doc_ids: list[str], texts: list[str]) -> "BM25Index":
+        """ Build the index from the texts of each document id """
+
+        postings_by_term = {}
+        doc_lengths = []
+
+        for doc_index, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+
+            for term, frequency in Counter(tokens).items():
+                postings_by_term.setdefault(term, []).append((doc_index, frequency))
+
+        vocabulary = sorted(postings_by_term)
+        indptr = [0]
+        postings = []
+        frequencies = []
+
+        for term in vocabulary:
+            for doc_index, frequency in postings_by_term[term]:
+                postings.append(doc_index)
+                frequencies.append(frequency)
+            indptr.append(len(postings))
+
+        return cls(doc_ids, vocabulary, indptr, postings, frequencies, doc_lengths)
+
+    def save(self, path: str) -> None:
+        """ Write the index arrays to a compressed .npz file """
+
+        np.savez_compressed(
+            path,
+            doc_ids     = self.doc_ids.astype(str),
+            vocabulary  = self.vocabulary.astype(str),
+            indptr      = self.indptr,
+            postings    = self.postings,
+            frequencies = self.frequencies.astype(np.int32),
+            doc_lengths = self.doc_lengths.astype(np.int32)
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """ Load an index written by save() """
+
+        with np.load(path, allow_pickle = False) as data:
+            return cls(
+                data["doc_ids"],
+                data["vocabulary"],
+                data["indptr"],
+                data["postings"],
+                data["frequencies"],
+                data["doc_lengths"]
+            )
+
+    @classmethod
+    def merge(cls, indexes: list["BM25Index"], keep: list[np.ndarray] | None = None) -> "BM25Index":
+        """ Concatenate the rows of several indexes without re-tokenizing, dropping the rows not kept """
+
+        keep = keep if keep is not None else [np.ones(len(index.doc_ids), dtype = bool) for index in indexes]
+        vocabulary, inverse = np.unique(np.concatenate([index.vocabulary.astype(str) for index in indexes] or [np.array([], dtype = str)]), return_inverse = True)
+
+        term_ids, postings, frequencies, doc_lengths = [], [], [], []
+        vocabulary_offset = row_offset = 0
+
+        for index, kept in zip(indexes, keep):
+            local_terms = inverse[vocabulary_offset:vocabulary_offset + len(index.vocabulary)]
+            vocabulary_offset += len(index.vocabulary)
+
+            # Rows are renumbered after the dropped ones, postings of dropped rows go away
+            rows = np.cumsum(kept) - 1 + row_offset
+            alive = kept[index.postings]
+
+            term_ids.append(np.repeat(local_terms, np.diff(index.indptr))[alive])
+            postings.append(rows[index.postings[alive]])
+            frequencies.append(index.frequencies[alive])
+            doc_lengths.append(index.doc_lengths[kept])
+            row_offset += int(kept.sum())
+
+        term_ids = np.concatenate(term_ids or [np.array([], dtype = np.int64)])
+
+        # A stable sort keeps the rows of each term in ascending order
+        order = np.argsort(term_ids, kind = "stable")
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(term_ids, minlength = len(vocabulary)))])
+
+        return cls(
+            np.arange(row_offset).astype(str),
+            vocabulary,
+            indptr,
+            np.concatenate(postings or [np.array([], dtype = np.int32)])[order],
+            np.concatenate(frequencies or [np.array([], dtype = np.float32)])[order],
+            np.concatenate(doc_lengths or [np.array([], dtype = np.float32)]),
+            indexes[0].k1 if indexes else 1.5,
+            indexes[0].b if indexes else 0.75
+        )
+
+    @property
+    def nbytes(self) -> int:
+        """ Approximate memory held by the index """
+
+        arrays = (self.doc_ids, self.vocabulary, self.indptr, self.postings, self.frequencies, self.doc_lengths, self.idf)
+        return sum(array.nbytes for array in arrays)
+
+    def score(self, idf: dict[str, float], average_length: float) -> np.ndarray:
+        """ BM25 score of every row for the query terms, weighted by the given idf and average length """
+
+        scores = np.zeros(len(self.doc_ids), dtype = np.float32)
+
+        for term, term_idf in idf.items():
+            term_id = self.term_index.get(term)
+            if term_id is None:
+                continue
+
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            docs = self.postings[start:end]
+            frequency = self.frequencies[start:end]
+
+            # Each document appears once per term, so fancy-indexed += is safe
+            norm = self.k1 * (1.0 - self.b + self.b * self.doc_lengths[docs] / (average_length or 1.0))
+            scores[docs] += term_idf * frequency * (self.k1 + 1.0) / (frequency + norm)
+
+        return scores
+
+    def search(self, query: str, k: int = 6) -> list[tuple[str, float]]:
+        """ Return the k best (doc_id, score) pairs for the query """
+
+        idf = {term: float(self.idf[self.term_index[term]]) for term in set(tokenize(query)) if term in self.term_index}
+        scores = self.score(idf, self.average_length)
+
+        if not scores.any():
+            return []
+
+        top = np.argsort(-scores)[:k]
+        return [(str(self.doc_ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+
+def reciprocal_rank_scores(rankings: list[list[str]], k: int = 60) -> dict[str, float]:
+    """ Score each id of the ranked lists by the sum of 1 / (k + rank) """
+
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+
+    return scores
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[str]:
+    """ Merge ranked id lists, best fused score first """
+
+    scores = reciprocal_rank_scores(rankings, k)
+    return sorted(scores, key = scores.get, reverse = True)
+
+
+# ============================== Hybrid retriever ==============================
+
+class HybridRetriever(BaseRetriever):
+    """ Fuses MultiVectorRetriever similarity hits with BM25 hits, returning docstore contents """
+
+    vector_retriever    : Any
+    lexical_index       : Any
+    mode                : str = "hybrid"
+    k                   : int = 6
+
+    def _vector_ids(self, sub_docs: list[Document]) -> list[str]:
+        id_key = self.vector_retriever.id_key
+        return list(dict.fromkeys(doc.metadata[id_key] for doc in sub_docs if id_key in doc.metadata))
+
+    def _lexical_ids(self, query: str) -> list[str]:
+        if self.mode == "vector" or self.lexical_index is None:
+            return []
+        return [doc_id for doc_id, _ in self.lexical_index.search(query, self.k)]
+
+    def _fuse(self, vector_ids: list[str], lexical_ids: list[str]) -> list[str]:
+        return reciprocal_rank_fusion([vector_ids, lexical_ids])[:self.k]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        vector_ids = []
+
+        if self.mode != "lexical":
+            try:
+                sub_docs = self.vector_retriever.vectorstore.similarity_search(query, **self.vector_retriever.search_kwargs)
+                vector_ids = self._vector_ids(sub_docs)
+
+            except Exception as e:
+                # Keep answering from the lexical index when the embedding provider is down
+                if self.mode == "vector" or self.lexical_index is None:
+                    raise
+                logger.warning(f"FASTAPI Lexical - HybridRetriever - Vector search failed, using lexical results only: {e}")
+
+        ids = self._fuse(vector_ids, self._lexical_ids(query))
+        return [doc for doc in self.vector_retriever.docstore.mget(ids) if doc is not None]
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> list[Document]:
+        vector_ids = []
+
+        if self.mode != "lexical":
+            try:
+                sub_docs = await self.vector_retriever.vectorstore.asimilarity_search(query, **self.vector_retriever.search_kwargs)
+                vector_ids = self._vector_ids(sub_docs)
+
+            except Exception as e:
+                # Keep answering from the lexical index when the embedding provider is down
+                if self.mode == "vector" or self.lexical_index is None:
+                    raise
+                logger.warning(f"FASTAPI Lexical - HybridRetriever - Vector search failed, using lexical results only: {e}")
+
+        ids = self._fuse(vector_ids, self._lexical_ids(query))
+        return [doc for doc in await self.vector_retriever.docstore.amget(ids) if doc is not None]
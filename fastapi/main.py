@@ -1,7 +1,19 @@
+import threading
 from fastapi import FastAPI
+from contextlib import asynccontextmanager
 from routers import router
+from services import prewarm_documents, load_corpus_search_index
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up the hot documents in the background, /ready reports the progress
+    threading.Thread(target = prewarm_documents, name = "prewarm", daemon = True).start()
+
+    # Preload the corpus search index so /search never reads the vectorstore
+    threading.Thread(target = load_corpus_search_index, name = "search-index", daemon = True).start()
+    yield
+
+app = FastAPI(lifespan = lifespan)
 
 #Include the routers
 app.include_router(router)
\ No newline at end of file
@@ -1,7 +1,7 @@
 import os 
 from enum import Enum
 from typing import Optional, Any
-from pydantic import BaseModel, constr, EmailStr, validator
+from pydantic import BaseModel, Field, constr, EmailStr, validator
 
 class RegisterUser(BaseModel):
     first_name: str
@@ -55,4 +55,14 @@ class PromptType(str, Enum):
 class UserPrompts(BaseModel):
     question: str
     prompt_type: PromptType
-    source : SourceType
\ No newline at end of file
+    source : SourceType
+
+class SearchMode(str, Enum):
+    vector = "vector"
+    hybrid = "hybrid"
+    lexical = "lexical"
+
+class SearchQuery(BaseModel):
+    q: str
+    k: int = Field(10, ge=1, le=100)
+    mode: SearchMode = SearchMode.vector
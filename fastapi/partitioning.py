@@ -0,0 +1,215 @@
+import os
+import re
+import time
+import shutil
+import logging
+import PyPDF2
+import tempfile
+import multiprocessing
+from typing import Any
+from collections import Counter
+from dotenv import load_dotenv
+from concurrent.futures import ProcessPoolExecutor
+from unstructured.partition.pdf import partition_pdf
+
+# Load env variables
+load_dotenv()
+
+# Logger configuration
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+# Log to console (dev only)
+if os.getenv('APP_ENV') == "development":
+    handler = logging.StreamHandler()
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+# Also log to a file
+file_handler = logging.FileHandler(os.getenv('FASTAPI_LOG_FILE', "fastapi_errors.log"))
+file_handler.setFormatter(formatter)
+logger.addHandler(file_handler)
+
+
+# Options of the hi_res partitioning, shared by the single and page-range paths
+PARTITION_OPTIONS = {
+    "extract_images_in_pdf"     : True,
+    "extract_image_block_types" : ["Image", "Table"],
+    "infer_table_structure"     : True
+}
+
+# By-title chunking applied to the partitioned elements
+CHUNKING_OPTIONS = {
+    "max_characters"                : 4000,
+    "new_after_n_chars"             : 3800,
+    "combine_text_under_n_chars"    : 2000
+}
+
+
+# Partitioning strategy of each page class: only tables and figures need hi_res OCR
+PAGE_STRATEGIES = {
+    "text"      : "fast",
+    "table"     : "hi_res",
+    "figure"    : "hi_res"
+}
+
+
+def classify_page(page: PyPDF2.PageObject, min_text_chars: int = 200, min_image_area: int = 40000, min_rules: int = 12, min_numeric_lines: int = 6) -> str:
+    """ Classify a page as text, table or figure from its text layer and drawing objects """
+
+    text = page.extract_text() or ""
+
+    # Pages without a usable text layer are scans or full-page figures that need OCR
+    if len(text.strip()) < min_text_chars:
+        return "figure"
+
+    resources = page.get("/Resources")
+    resources = resources.get_object() if resources is not None else {}
+    xobjects = resources.get("/XObject")
+    xobjects = xobjects.get_object() if xobjects is not None else {}
+
+    # Small images are running headers and logos, not figures
+    for name in xobjects:
+        xobject = xobjects[name].get_object()
+        if xobject.get("/Subtype") == "/Image" and int(xobject.get("/Width", 0)) * int(xobject.get("/Height", 0)) >= min_image_area:
+            return "figure"
+
+    # Table rules are drawn as rectangles and line segments
+    contents = page.get_contents()
+    data = contents.get_data() if contents is not None else b""
+    if len(re.findall(rb"\sre\s", data)) + len(re.findall(rb"\sl\s", data)) // 2 >= min_rules:
+        return "table"
+
+    # Borderless tables show up as rows of figures
+    numeric_lines = sum(1 for line in text.splitlines() if len(re.findall(r"-?\d[\d,.]*%?", line)) >= 3)
+    if numeric_lines >= min_numeric_lines:
+        return "table"
+
+    return "text"
+
+
+def safe_classify_page(page: PyPDF2.PageObject, page_number: int) -> str:
+    """ Classify a page, sending malformed pages through hi_res like the unclassified path """
+
+    try:
+        return classify_page(page)
+
+    except Exception as e:
+        logger.warning(f"FASTAPI Partitioning - safe_classify_page() - Could not classify page {page_number}, using hi_res: {e}")
+        return "figure"
+
+
+def get_page_segments(page_strategies: list[str], pages_per_range: int) -> list[tuple[int, int, str]]:
+    """ Split the pages into consecutive [start, end) ranges sharing one strategy """
+
+    segments = []
+    start = 0
+
+    for page in range(1, len(page_strategies) + 1):
+        if page == len(page_strategies) or page_strategies[page] != page_strategies[start] or page - start >= pages_per_range:
+            segments.append((start, page, page_strategies[start]))
+            start = page
+
+    return segments
+
+
+def write_page_range(reader: PyPDF2.PdfReader, start: int, end: int, output_file: str) -> None:
+    """ Write pages [start, end) of a PDF to a new file """
+
+    writer = PyPDF2.PdfWriter()
+    for page in reader.pages[start:end]:
+        writer.add_page(page)
+
+    with open(output_file, "wb") as file:
+        writer.write(file)
+
+
+def partition_page_range(range_file: str, starting_page_number: int, image_output_dir: str, strategy: str = "hi_res") -> tuple[list[Any], float]:
+    """ Worker: partition one page range, returning its elements and the time it took """
+
+    started = time.perf_counter()
+
+    # Text-only pages are read straight from the text layer
+    if strategy == "fast":
+        elements = partition_pdf(
+            filename                = range_file,
+            starting_page_number    = starting_page_number,
+            strategy                = "fast"
+        )
+
+    # Page numbers, and so the names of the extracted images, stay those of the full PDF
+    else:
+        elements = partition_pdf(
+            filename                        = range_file,
+            starting_page_number            = starting_page_number,
+            extract_image_block_output_dir  = image_output_dir,
+            **PARTITION_OPTIONS
+        )
+
+    return elements, time.perf_counter() - started
+
+
+def partition_pdf_in_ranges(
+    pdf_file: str,
+    image_output_dir: str,
+    starting_page_number: int = 1,
+    workers: int = 4,
+    pages_per_range: int = 16,
+    classify_pages: bool = False
+) -> tuple[list[Any], dict[str, Any]]:
+    """ Partition page ranges of a PDF in a process pool, returning the elements in page order and the page classes and per-range timings """
+
+    reader = PyPDF2.PdfReader(pdf_file)
+
+    # Every page goes through hi_res unless the classifier finds it is plain text
+    if classify_pages:
+        page_classes = [safe_classify_page(page, page_number) for page_number, page in enumerate(reader.pages, start = 1)]
+    else:
+        page_classes = ["figure"] * len(reader.pages)
+
+    page_ranges = get_page_segments([PAGE_STRATEGIES[page_class] for page_class in page_classes], pages_per_range)
+
+    logger.info(f"FASTAPI Partitioning - partition_pdf_in_ranges() - Partitioning {len(reader.pages)} pages in {len(page_ranges)} ranges with {workers} workers, page classes {dict(Counter(page_classes))}")
+
+    range_directory = tempfile.mkdtemp(prefix = "page_ranges_", dir = os.path.dirname(pdf_file))
+    try:
+        range_files = []
+        for start, end, _ in page_ranges:
+            range_file = os.path.join(range_directory, f"pages_{start + 1}_{end}.pdf")
+            write_page_range(reader, start, end, range_file)
+            range_files.append(range_file)
+
+        # Spawned workers only import this module, not the app and its open stores
+        with ProcessPoolExecutor(
+            max_workers = max(1, min(workers, len(page_ranges))),
+            mp_context  = multiprocessing.get_context("spawn")
+        ) as executor:
+            futures = [
+                executor.submit(partition_page_range, range_file, starting_page_number + start, image_output_dir, strategy)
+                for range_file, (start, _, strategy) in zip(range_files, page_ranges)
+            ]
+
+            # Collected in submission order, so the elements stay in page order
+            elements = []
+            timings = []
+            for future, (start, end, strategy) in zip(futures, page_ranges):
+                range_elements, seconds = future.result()
+                elements.extend(range_elements)
+                timings.append({
+                    "pages"     : f"{start + 1}-{end}",
+                    "strategy"  : strategy,
+                    "elements"  : len(range_elements),
+                    "seconds"   : round(seconds, 3)
+                })
+                logger.info(f"FASTAPI Partitioning - partition_pdf_in_ranges() - Pages {start + 1}-{end} ({strategy}): {len(range_elements)} elements in {seconds:.1f}s")
+
+    finally:
+        shutil.rmtree(range_directory, ignore_errors = True)
+
+    details = {
+        "page_classes"  : dict(Counter(page_classes)),
+        "page_ranges"   : timings
+    }
+
+    return elements, details
@@ -1,9 +1,9 @@
 import os
 import logging
 from dotenv import load_dotenv
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi import APIRouter, HTTPException, status, Depends
-from models import RegisterUser, LoginUser, ExploreDocs, LoadDocument, UserPrompts
+from models import RegisterUser, LoginUser, ExploreDocs, LoadDocument, UserPrompts, SearchQuery
 
 # Importing all the necessary functions
 from services import          \
@@ -12,10 +12,17 @@ register_user,                \
 login_user,                   \
 verify_token,                 \
 explore_documents,            \
-load_document,                \
-download_files_from_s3,       \
-generate_summary,             \
-invoke_pipeline
+aload_document,               \
+adownload_files_from_s3,      \
+agenerate_summary,            \
+ainvoke_pipeline,             \
+astream_pipeline,             \
+get_cache_stats,              \
+get_trust_score,              \
+submit_ingestion,             \
+get_ingestion_status,         \
+get_readiness,                \
+search_corpus
 
 # Setup the API router
 router = APIRouter()
@@ -53,6 +60,15 @@ def health() -> JSONResponse:
     })
 
 
+# Route for readiness check
+@router.get("/ready")
+def ready() -> JSONResponse:
+    ''' Check if the startup warm-up of the hot documents has finished '''
+
+    logger.info("GET - /ready request received")
+    return get_readiness()
+
+
 # Route for registering user
 @router.post("/register")
 def register(user: RegisterUser):
@@ -138,7 +154,7 @@ def explore_docs(
         403: {'description': 'Returns all available data about a document id'}
     }
 )
-def load_docs(
+async def load_docs(
     document_id : str,
     token       : str = Depends(verify_token)
 ) -> JSONResponse:
@@ -147,10 +163,10 @@ def load_docs(
     logger.info(f"FASTAPI Routers - load_docs = GET - /load_docs/{document_id} request received")
 
     logger.info(f"FASTAPI Routers - load_docs = Downloading the files present in s3 bucket - {document_id} folder")
-    download_files_from_s3(document_id)
+    await adownload_files_from_s3(document_id)
     logger.info(f"FASTAPI Routers - load_docs = Loading the entire document with id = {document_id}")
     
-    return load_document(document_id)
+    return await aload_document(document_id)
 
 
 # Route for generating summary 
@@ -162,14 +178,14 @@ def load_docs(
         403: {'description': 'Returns the summary for a document id'}
     }
 )
-def doc_summary(
+async def doc_summary(
     document_id : str,
     token       : str = Depends(verify_token)
 ) -> JSONResponse:
     """ Generate a summary for the specified document """
     
     logger.info(f"FASTAPI Routers - doc_summary = GET - /summary/{document_id} request received")
-    return generate_summary(document_id)
+    return await agenerate_summary(document_id)
 
 
 # Route for RAG implementation
@@ -181,7 +197,7 @@ def doc_summary(
         403: {'description': 'Returns a chat response for a document id'}
     }
 )
-def chatbot(
+async def chatbot(
     prompt      : UserPrompts,
     document_id : str,
     token       : str = Depends(verify_token)
@@ -189,4 +205,121 @@ def chatbot(
     
     logger.info(f"FASTAPI Routers - chatbot = GET - /chatbot/{document_id} request received")
     
-    return invoke_pipeline(document_id, prompt.question, prompt.prompt_type, prompt.source, token)
\ No newline at end of file
+    return await ainvoke_pipeline(document_id, prompt.question, prompt.prompt_type, prompt.source, token)
+
+
+# Route for streaming RAG responses
+@router.post("/chatbot/{document_id}/stream",
+    response_class = StreamingResponse,
+    responses = {
+        401: {'description': 'Invalid or expired token'},
+        402: {'description': 'Insufficient permissions'},
+        403: {'description': 'Streams a chat response for a document id as server-sent events'}
+    }
+)
+async def chatbot_stream(
+    prompt      : UserPrompts,
+    document_id : str,
+    token       : str = Depends(verify_token)
+) -> StreamingResponse:
+    
+    logger.info(f"FASTAPI Routers - chatbot_stream = POST - /chatbot/{document_id}/stream request received")
+    
+    return StreamingResponse(
+        astream_pipeline(document_id, prompt.question, prompt.prompt_type, prompt.source, token),
+        media_type = "text/event-stream"
+    )
+
+
+# Route for cache statistics
+@router.get("/cache_stats",
+    response_class = JSONResponse,
+    responses = {
+        401: {'description': 'Invalid or expired token'},
+        402: {'description': 'Insufficient permissions'},
+        403: {'description': 'Returns the hit rates of the retrieval caches'}
+    }
+)
+def cache_stats(
+    token       : str = Depends(verify_token)
+) -> JSONResponse:
+    """ Report the hit rates of the retrieval caches """
+
+    logger.info(f"FASTAPI Routers - cache_stats = GET - /cache_stats request received")
+    return get_cache_stats()
+
+
+# Route for polling background trust scores
+@router.get("/trust_score/{score_id}",
+    response_class = JSONResponse,
+    responses = {
+        401: {'description': 'Invalid or expired token'},
+        402: {'description': 'Insufficient permissions'},
+        403: {'description': 'Returns the trust score of a chatbot answer'}
+    }
+)
+def trust_score(
+    score_id    : str,
+    token       : str = Depends(verify_token)
+) -> JSONResponse:
+    """ Fetch the trust score of an answer scored in the background """
+
+    logger.info(f"FASTAPI Routers - trust_score = GET - /trust_score/{score_id} request received")
+    return get_trust_score(score_id)
+
+
+# Route for queueing the ingestion of a document
+@router.post("/ingest/{document_id}",
+    response_class = JSONResponse,
+    responses = {
+        401: {'description': 'Invalid or expired token'},
+        402: {'description': 'Insufficient permissions'},
+        403: {'description': 'Queues the ingestion of a document id'}
+    }
+)
+def ingest(
+    document_id : str,
+    token       : str = Depends(verify_token)
+) -> JSONResponse:
+    """ Queue the download, preprocessing and indexing of a document """
+
+    logger.info(f"FASTAPI Routers - ingest = POST - /ingest/{document_id} request received")
+    return submit_ingestion(document_id)
+
+
+# Route for checking the ingestion of a document
+@router.get("/ingest/{document_id}",
+    response_class = JSONResponse,
+    responses = {
+        401: {'description': 'Invalid or expired token'},
+        402: {'description': 'Insufficient permissions'},
+        403: {'description': 'Returns the ingestion status of a document id'}
+    }
+)
+def ingest_status(
+    document_id : str,
+    token       : str = Depends(verify_token)
+) -> JSONResponse:
+    """ Report the stage, progress and timings of a document ingestion """
+
+    logger.info(f"FASTAPI Routers - ingest_status = GET - /ingest/{document_id} request received")
+    return get_ingestion_status(document_id)
+
+
+# Route for searching across every ingested document
+@router.get("/search",
+    response_class = JSONResponse,
+    responses = {
+        401: {'description': 'Invalid or expired token'},
+        402: {'description': 'Insufficient permissions'},
+        403: {'description': 'Returns the documents matching a query, with titles and snippets'}
+    }
+)
+def search(
+    search      : SearchQuery = Depends(),
+    token       : str = Depends(verify_token)
+) -> JSONResponse:
+    """ Find which publications cover a topic """
+
+    logger.info(f"FASTAPI Routers - search = GET - /search?q={search.q} request received")
+    return search_corpus(search.q, search.k, search.mode.value)
@@ -0,0 +1,284 @@
+import os
+import re
+import logging
+import threading
+import numpy as np
+from typing import Any
+from dotenv import load_dotenv
+from lexical import BM25Index, reciprocal_rank_scores, tokenize
+
+# Load env variables
+load_dotenv()
+
+# Logger configuration
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+# Log to console (dev only)
+if os.getenv('APP_ENV') == "development":
+    handler = logging.StreamHandler()
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+# Also log to a file
+file_handler = logging.FileHandler(os.getenv('FASTAPI_LOG_FILE', "fastapi_errors.log"))
+file_handler.setFormatter(formatter)
+logger.addHandler(file_handler)
+
+
+def make_snippet(text: str, length: int) -> str:
+    """ Collapse whitespace and cut the text at a word boundary """
+
+    text = re.sub(r"\s+", " ", text or "").strip()
+    if len(text) <= length:
+        return text
+
+    return text[:length].rsplit(" ", 1)[0] + " ..."
+
+
+class CorpusSearchIndex:
+    """ In-memory snapshot of the shared full text collection, searched across every document """
+
+    def __init__(self, snippet_length: int = 240, snippets_per_document: int = 3, chunk_pool: int = 100, max_segments: int = 16):
+        self.snippet_length         = snippet_length
+        self.snippets_per_document  = snippets_per_document
+        self.chunk_pool             = chunk_pool
+        self.max_segments           = max_segments
+
+        # Number of chunks of each indexed document. Each ingest adds a segment holding
+        # only its own chunks, so it never re-tokenizes the rest of the corpus
+        self._documents             = {}
+        self._snapshot              = None
+        self._loaded                = False
+        self._load_error            = None
+        self._lock                  = threading.Lock()
+
+    def __contains__(self, document_id: str) -> bool:
+        return document_id in self._documents
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def _segment(self, document_ids: list[str], texts: list[str], embeddings) -> dict[str, Any]:
+        """ Build a segment over the chunks of one or more documents """
+
+        matrix = np.asarray(embeddings, dtype = np.float32).reshape(len(texts), -1)
+
+        # Rows are normalized once so a query is a single matrix product
+        norms = np.linalg.norm(matrix, axis = 1, keepdims = True)
+        matrix = matrix / np.where(norms == 0, 1.0, norms)
+
+        return {
+            "document_ids"  : np.asarray(document_ids),
+            "snippets"      : [make_snippet(text, self.snippet_length) for text in texts],
+            "matrix"        : matrix,
+            "lexical_index" : BM25Index.build([str(row) for row in range(len(texts))], texts),
+            "live"          : np.ones(len(texts), dtype = bool)
+        }
+
+    @staticmethod
+    def _without(segment: dict[str, Any], document_id: str) -> dict[str, Any] | None:
+        """ Hide the rows of a document in a segment, None once no row is left """
+
+        rows = segment["document_ids"] == document_id
+        if not rows.any():
+            return segment
+
+        # Copied, since readers may still hold the previous snapshot
+        live = segment["live"] & ~rows
+        return {**segment, "live": live} if live.any() else None
+
+    @staticmethod
+    def _merge(segments: list[dict[str, Any]]) -> dict[str, Any]:
+        """ Merge segments into one, dropping the hidden rows """
+
+        keep = [segment["live"] for segment in segments]
+
+        return {
+            "document_ids"  : np.concatenate([segment["document_ids"][live] for segment, live in zip(segments, keep)]),
+            "snippets"      : [snippet for segment, live in zip(segments, keep) for snippet, alive in zip(segment["snippets"], live) if alive],
+            "matrix"        : np.vstack([segment["matrix"][live] for segment, live in zip(segments, keep)]),
+            "lexical_index" : BM25Index.merge([segment["lexical_index"] for segment in segments], keep),
+            "live"          : np.ones(int(sum(live.sum() for live in keep)), dtype = bool)
+        }
+
+    def _publish(self, segments: list[dict[str, Any]]) -> None:
+        """ Swap in the segments searched by queries """
+
+        # The smallest half of the segments is merged into one, so large segments are rarely rewritten
+        # and hidden rows are dropped as their segment shrinks
+        if len(segments) > self.max_segments:
+            by_size = sorted(range(len(segments)), key = lambda position: int(segments[position]["live"].sum()))
+            smallest = set(by_size[:len(segments) // 2 + 1])
+
+            merged = self._merge([segments[position] for position in sorted(smallest)])
+            segments = [segment for position, segment in enumerate(segments) if position not in smallest] + [merged]
+
+        # Readers keep using the previous snapshot until this one is swapped in
+        self._snapshot = {
+            "segments"      : segments,
+            "offsets"       : np.cumsum([0] + [len(segment["live"]) for segment in segments]),
+            "document_ids"  : np.concatenate([segment["document_ids"] for segment in segments]) if segments else np.asarray([]),
+            "live"          : np.concatenate([segment["live"] for segment in segments]) if segments else np.zeros(0, dtype = bool)
+        }
+
+    def mark_load_failed(self, error: str) -> None:
+        """ Record why the last load of the collection failed, reported until a load succeeds """
+
+        self._load_error = error
+
+    def load(self, records: dict[str, list]) -> None:
+        """ Load the ids, documents, embeddings and metadatas returned by a Chroma get() """
+
+        grouped = {}
+        for text, embedding, metadata in zip(records["documents"], records["embeddings"], records["metadatas"]):
+            document_id = (metadata or {}).get("document_id")
+            if document_id is None:
+                continue
+
+            texts, embeddings = grouped.setdefault(document_id, ([], []))
+            texts.append(text)
+            embeddings.append(embedding)
+
+        with self._lock:
+            # Documents set while the collection was being read are already newer
+            grouped = {document_id: chunks for document_id, chunks in grouped.items() if document_id not in self._documents}
+            segments = list(self._snapshot["segments"]) if self._snapshot else []
+
+            if grouped:
+                document_ids = [document_id for document_id, (texts, _) in grouped.items() for _ in texts]
+                texts = [text for texts, _ in grouped.values() for text in texts]
+                embeddings = [embedding for _, embeddings in grouped.values() for embedding in embeddings]
+
+                segments.insert(0, self._segment(document_ids, texts, embeddings))
+                self._documents.update({document_id: len(texts) for document_id, (texts, _) in grouped.items()})
+
+            self._publish(segments)
+            self._loaded = True
+            self._load_error = None
+
+        logger.info(f"FASTAPI Search - CorpusSearchIndex.load() - Loaded {self.stats()}")
+
+    def set_document(self, document_id: str, texts: list[str], embeddings) -> None:
+        """ Replace the chunks of one document """
+
+        # Only the chunks of this document are tokenized
+        new_segments = [self._segment([document_id] * len(texts), texts, embeddings)] if texts else []
+
+        with self._lock:
+            segments = self._snapshot["segments"] if self._snapshot else []
+            segments = [kept for kept in (self._without(previous, document_id) for previous in segments) if kept is not None]
+
+            self._publish(segments + new_segments)
+            self._documents[document_id] = len(texts)
+
+        logger.info(f"FASTAPI Search - CorpusSearchIndex.set_document() - Indexed {len(texts)} chunks of document {document_id}")
+
+    def _lexical_scores(self, segments: list[dict[str, Any]], query: str) -> np.ndarray:
+        """ BM25 scores of every row, with the idf and average length of the live rows of the whole corpus """
+
+        row_count = sum(int(segment["live"].sum()) for segment in segments)
+        average_length = sum(float(segment["lexical_index"].doc_lengths[segment["live"]].sum()) for segment in segments) / (row_count or 1)
+
+        idf = {}
+        for term in set(tokenize(query)):
+            frequency = 0
+            for segment in segments:
+                index = segment["lexical_index"]
+                term_id = index.term_index.get(term)
+                if term_id is not None:
+                    frequency += int(segment["live"][index.postings[index.indptr[term_id]:index.indptr[term_id + 1]]].sum())
+
+            if frequency:
+                idf[term] = float(np.log(1.0 + (row_count - frequency + 0.5) / (frequency + 0.5)))
+
+        return np.concatenate([segment["lexical_index"].score(idf, average_length) for segment in segments])
+
+    def search(self, query: str, query_vector = None, k: int = 10, lexical: bool = False) -> list[dict[str, Any]]:
+        """ Rank documents by their best matching chunks, with a few snippets each """
+
+        snapshot = self._snapshot
+        if snapshot is None or not snapshot["live"].any():
+            return []
+
+        segments = snapshot["segments"]
+        live = snapshot["live"]
+
+        rankings = []
+        scores = {}
+
+        if query_vector is not None:
+            query_vector = np.asarray(query_vector, dtype = np.float32)
+            query_vector = query_vector / (np.linalg.norm(query_vector) or 1.0)
+            similarities = np.concatenate([segment["matrix"] @ query_vector for segment in segments])
+            similarities[~live] = -np.inf
+
+            pool = min(self.chunk_pool, int(live.sum()))
+            top = np.argpartition(-similarities, pool - 1)[:pool]
+            top = top[np.argsort(-similarities[top])]
+
+            rankings.append(top.tolist())
+            scores = {int(row): float(similarities[row]) for row in top}
+
+        if lexical:
+            lexical_scores = self._lexical_scores(segments, query)
+            lexical_scores[~live] = 0.0
+
+            top = np.argsort(-lexical_scores)[:self.chunk_pool]
+            hits = [(int(row), float(lexical_scores[row])) for row in top if lexical_scores[row] > 0]
+
+            rankings.append([row for row, _ in hits])
+            if not scores:
+                scores = dict(hits)
+
+        rows = rankings[0]
+
+        # Fused results are scored by the fusion itself
+        if len(rankings) > 1:
+            scores = reciprocal_rank_scores(rankings)
+            rows = sorted(scores, key = scores.get, reverse = True)
+
+        results = {}
+        for row in rows:
+            document_id = str(snapshot["document_ids"][row])
+            result = results.get(document_id)
+
+            if result is None:
+                if len(results) >= k:
+                    continue
+                result = results[document_id] = {
+                    "document_id"   : document_id,
+                    "score"         : round(scores[row], 4) if row in scores else None,
+                    "snippets"      : []
+                }
+
+            if len(result["snippets"]) < self.snippets_per_document:
+                segment = int(np.searchsorted(snapshot["offsets"], row, side = "right")) - 1
+                result["snippets"].append(segments[segment]["snippets"][row - snapshot["offsets"][segment]])
+
+        return list(results.values())
+
+    def stats(self) -> dict[str, Any]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {"loaded": self._loaded, "load_error": self._load_error, "documents": 0, "chunks": 0, "segments": 0, "memory_mb": 0.0}
+
+        return {
+            "loaded"    : self._loaded,
+            "load_error": self._load_error,
+            "documents" : len(self._documents),
+            "chunks"    : int(snapshot["live"].sum()),
+            "segments"  : len(snapshot["segments"]),
+            "memory_mb" : round(sum(segment["matrix"].nbytes + segment["lexical_index"].nbytes for segment in snapshot["segments"]) / (1024 * 1024), 2)
+        }
+
+
+# Shared corpus search index for the whole process
+corpus_search_index = CorpusSearchIndex(
+    snippet_length          = int(os.getenv("SEARCH_SNIPPET_LENGTH", 240)),
+    snippets_per_document   = int(os.getenv("SEARCH_SNIPPETS_PER_DOCUMENT", 3)),
+    chunk_pool              = int(os.getenv("SEARCH_CHUNK_POOL", 100)),
+    max_segments            = int(os.getenv("SEARCH_MAX_SEGMENTS", 16))
+)
@@ -1,20 +1,26 @@
 import os
-import io
-import re
 import jwt
 import json
+import time
+import shutil
 import uuid
+import tempfile
 import hmac
 import boto3
 import base64
 import PyPDF2
+import asyncio
 import hashlib
 import logging
+import chromadb
 import tiktoken
 import datetime
+import threading
 from PIL import Image
 from typing import Any
-from openai import OpenAI
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 from unidecode import unidecode
 from datetime import timezone, timedelta
@@ -23,22 +29,36 @@ from snowflake.connector import DictCursor
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import status, HTTPException, Depends
 from connectDB import create_connection_to_snowflake, close_connection
+from jobs import ingestion_jobs, IngestionQueueFull
+from lexical import BM25Index, HybridRetriever
+from search import corpus_search_index
+from partitioning import partition_pdf_in_ranges, PARTITION_OPTIONS, CHUNKING_OPTIONS
+from imaging import screen_images, deduplicate_images
+from caches import                \
+retriever_registry,                 \
+embedding_cache,                    \
+query_embedding_cache,              \
+answer_cache,                       \
+semantic_answer_cache,              \
+trust_score_store,                  \
+CachedEmbeddings
 
 # RAG Specific Imports
 from cleanlab_studio import Studio
 from langchain_chroma import Chroma
 from langchain_openai import ChatOpenAI
-from langchain.storage import InMemoryStore
+from langchain.storage import LocalFileStore, EncoderBackedStore
 from langchain_core.documents import Document
 from langchain_openai import OpenAIEmbeddings
 from langchain_core.messages import HumanMessage
 from unstructured.partition.pdf import partition_pdf
+from unstructured.chunking.title import chunk_by_title
 from langchain_nvidia_ai_endpoints import ChatNVIDIA
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain.retrievers.multi_vector import MultiVectorRetriever
-from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+from langchain_core.runnables import RunnableLambda
 import unstructured_pytesseract as pytesseract
 
 # # Provide path to Tesseract OCR (Windows only)
@@ -47,6 +67,12 @@ import unstructured_pytesseract as pytesseract
 # Tesseract OCR - Homebrew (Mac OS only)
 # pytesseract.pytesseract.tesseract_cmd = "/opt/homebrew/bin/tesseract"
 
+# File locks are only available on Unix, elsewhere builds are guarded within the process only
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 # Load env variables
 load_dotenv()
 
@@ -69,6 +95,16 @@ logger.addHandler(file_handler)
 # Secret key
 SECRET_KEY = os.getenv("SECRET_KEY")
 
+# Embedding model used for every vectorstore
+EMBEDDING_MODEL = "text-embedding-3-large"
+
+# Shared embedding client, backed by the on-disk embedding cache
+_embeddings = None
+
+# Corpus-wide full_text and report collections, filtered by document_id
+_vectorstores = {}
+_vectorstores_lock = threading.Lock()
+
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl = 'login', auto_error = False)
 
@@ -519,68 +555,105 @@ def load_document(document_id):
             'message'   : "Could not fetch the user selected document. Something went wrong."
         })
     
-# Helper function to download files from S3 bucket
-def download_files_from_s3(document_id):
-    logger.info(f"FASTAPI Services - download_files_from_s3() - Downloading files from s3 bucket to local")
-    logger.info(f"FASTAPI Services - download_files_from_s3() - Creating S3 Client")
+class DocumentDownloadFailed(Exception):
+    """ Raised when the files of a document cannot be fetched from S3 """
+
+
+def find_document_pdf(local_dir):
+    """ Return the name of the PDF file in a document directory, None if there is none """
+
+    if not os.path.isdir(local_dir):
+        return None
+
+    for file in os.listdir(local_dir):
+        if file.endswith(".pdf"):
+            return file
+
+    return None
+
+
+def fetch_document_files(document_id):
+    """ Download the files of a document into a staging directory and rename it into place, raising on failure """
+
+    local_dir = get_document_path(document_id)
+
+    # Checking if the document_id directory already holds the downloaded files
+    if find_document_pdf(local_dir) is not None:
+        logger.info(f"FASTAPI Services - fetch_document_files() - Local directory for {document_id} already contains the PDF. Skipping download.")
+        return local_dir
 
-    # Create S3 Client
     s3_client = boto3.client(
         's3',
         aws_access_key_id       = os.getenv("AWS_ACCESS_KEY_ID"),
         aws_secret_access_key   = os.getenv("AWS_SECRET_ACCESS_KEY")
     )
 
-    logger.info(f"FASTAPI Services - download_files_from_s3() - S3 Client created")
-
     bucket_name = os.getenv("BUCKET_NAME")
-    s3_folder_path = f"{bucket_name}/{document_id}"
-    local_dir = os.path.join(os.getcwd(), os.getenv("DOWNLOAD_DIRECTORY"), document_id)
-    
-    # Checking if the document_id directory already exists
-    if os.path.exists(local_dir) and os.listdir(local_dir):
-        logger.info(f"FASTAPI Services - download_files_from_s3() - Local directory for {document_id} already exists and contains files. Skipping download.")
-        
-        return JSONResponse({
-            'status' : status.HTTP_200_OK,
-            'type' : 'string',
-            'message' : 'Files already exist locally. Now download required'
-        })
-    
-    # Creating directory locally if it does not exist
-    if not os.path.exists(local_dir):
-        logger.info(f"FASTAPI Services - download_files_from_s3() - Creating local directory to store the files in {document_id}")
-        os.makedirs(local_dir)
+    response = s3_client.list_objects_v2(Bucket = bucket_name, Prefix = document_id)
+    logger.info(f"FASTAPI Services - fetch_document_files() - Listed all files in {document_id}")
 
-    try:
-        response = s3_client.list_objects_v2(Bucket = bucket_name, Prefix = document_id)
-        logger.info(f"FASTAPI Services - download_files_from_s3() - Listed all files in {document_id}")
+    if 'Contents' not in response:
+        raise DocumentDownloadFailed(f"No files found in s3://{bucket_name}/{document_id}")
 
-        if 'Contents' not in response:
-            logger.info(f"FASTAPI Services - download_files_from_s3() - No files found in specified folder path: s3://{bucket_name}/{s3_folder_path}")
-            
-            return JSONResponse({
-                'status' : 404,
-                'type'   : 'string',
-                'message' : 'No files found in the specified folder path'
-            })
-        
-        # s3://publications-info/document_id/
-        for obj in response['Contents']:
-            logger.info(f"FASTAPI Services - download_files_from_s3() - Downloading files")
-            
-            file_key = obj['Key']
-            file_name = os.path.join(local_dir, os.path.basename(file_key))
-            
+    # Readers only ever see the document directory once every file is complete
+    download_root = os.path.dirname(local_dir)
+    os.makedirs(download_root, exist_ok = True)
+    staging_dir = tempfile.mkdtemp(prefix = f".{document_id}_", dir = download_root)
+
+    try:
+        def download(file_key):
+            file_name = os.path.join(staging_dir, os.path.basename(file_key))
             s3_client.download_file(bucket_name, file_key, file_name)
-            logger.info(f"FASTAPI Services - download_files_from_s3() - Downloaded {file_name}")
-        
+            logger.info(f"FASTAPI Services - fetch_document_files() - Downloaded {file_name}")
+
+        # Download the files concurrently, a few at a time
+        with ThreadPoolExecutor(max_workers = int(os.getenv("S3_DOWNLOAD_CONCURRENCY", 8))) as executor:
+            list(executor.map(download, [obj['Key'] for obj in response['Contents']]))
+
+        if find_document_pdf(staging_dir) is None:
+            raise DocumentDownloadFailed(f"No PDF file found in s3://{bucket_name}/{document_id}")
+
+        # Leftovers of an older, incomplete download are replaced
+        if os.path.isdir(local_dir) and find_document_pdf(local_dir) is None:
+            shutil.rmtree(local_dir)
+
+        try:
+            os.rename(staging_dir, local_dir)
+
+        except OSError:
+            # Another download of the same document finished first
+            if find_document_pdf(local_dir) is None:
+                raise
+
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors = True)
+
+    logger.info(f"FASTAPI Services - fetch_document_files() - Files of {document_id} moved into {local_dir}")
+    return local_dir
+
+
+# Helper function to download files from S3 bucket
+def download_files_from_s3(document_id):
+    logger.info(f"FASTAPI Services - download_files_from_s3() - Downloading files from s3 bucket to local")
+
+    try:
+        fetch_document_files(document_id)
+
         return JSONResponse({
             'status'    : status.HTTP_200_OK,
             'type'      : 'string',
             'message'   : 'Files downloaded successfully'
         })
-              
+
+    except DocumentDownloadFailed as e:
+        logger.info(f"FASTAPI Services - download_files_from_s3() - {e}")
+
+        return JSONResponse({
+            'status' : 404,
+            'type'   : 'string',
+            'message' : 'No files found in the specified folder path'
+        })
+
     except Exception as e:
         logger.error(f"FASTAPI Services Error - download_files_from_s3() encountered an error: {e}")
         
@@ -590,6 +663,20 @@ def download_files_from_s3(document_id):
             'message'   : 'An error occured while downloading files from S3'
         })
     
+# Helper function to download files from S3 bucket without blocking the event loop
+async def adownload_files_from_s3(document_id):
+
+    # boto3 is blocking, so the download runs on a worker thread
+    return await asyncio.to_thread(download_files_from_s3, document_id)
+
+
+# Helper function to load the document without blocking the event loop
+async def aload_document(document_id):
+    
+    # The Snowflake connector is blocking, so it runs on a worker thread
+    return await asyncio.to_thread(load_document, document_id)
+
+    
 # Helper function to extract text from PDF document
 def extract_text_from_document(document_id):
     logger.info(f"FASTAPI Services - extract_text_from_document() - Extracting text from document with id = {document_id}")
@@ -627,29 +714,32 @@ def extract_text_from_document(document_id):
     except Exception as e:
         logger.error(f"FASTAPI Services Error - extract_text_from_document() encountered an error: {e}")
 
-# Helper function to generate summary of PDF document
-def generate_summary(document_id):
-    logger.info(f"FASTAPI Services - generate_summary() - Generating summary for document {document_id}")
+# Shared async client for summary generation
+_summary_client = None
+
+# Helper function to generate summary of PDF document without blocking the event loop
+async def agenerate_summary(document_id):
+    logger.info(f"FASTAPI Services - agenerate_summary() - Generating summary for document {document_id}")
+
+    global _summary_client
 
-    # Extracting text from the document pdf file
-    text = extract_text_from_document(document_id)
-    logger.info(f"FASTAPI Services - generate_summary() - {document_id} - Text extracted and ready for summarization")
+    # Extracting text from the document pdf file, PyPDF2 is blocking
+    text = await asyncio.to_thread(extract_text_from_document, document_id)
+    logger.info(f"FASTAPI Services - agenerate_summary() - {document_id} - Text extracted and ready for summarization")
 
     try:
-        # Creating OpenAI client
-        client = OpenAI(
-            base_url    = os.getenv("NVIDIA_URL_SUMMARY"),
-            api_key     = os.getenv("NVIDIA_API_KEY_SUMMARY")
-        )
-        logger.info(f"FASTAPI Services - generate_summary() - OpenAI Client created successfully")
+        if _summary_client is None:
+            _summary_client = AsyncOpenAI(
+                base_url    = os.getenv("NVIDIA_URL_SUMMARY"),
+                api_key     = os.getenv("NVIDIA_API_KEY_SUMMARY")
+            )
 
         message = [{
             'role'      : 'user', 
             'content'   : f"Conclude the summary in 3-5 sensible complete sentences for text, no extra context needed: \n {text}"
         }]
-        logger.info(f"FASTAPI Services - generate_summary() - Message/Prompt created successfully")
 
-        completion = client.chat.completions.create(
+        completion = await _summary_client.chat.completions.create(
             model       = "meta/llama-3.1-405b-instruct",
             messages    = message,
             temperature = 0.2, 
@@ -657,15 +747,13 @@ def generate_summary(document_id):
             max_tokens  = 150,
             stream      = True
         )
-        logger.info(f"FASTAPI Services - generate_summary() - NVIDIA model defined successfully")
 
         summary = ""
-        for chunk in completion:
+        async for chunk in completion:
             if chunk.choices[0].delta.content is not None:
-                logger.info(f"FASTAPI Services - generate_summary() - Collecting generated summary")
                 summary += chunk.choices[0].delta.content
         
-        logger.info(f"FASTAPI Services - generate_summary() - {document_id} - Summary generated successfully")
+        logger.info(f"FASTAPI Services - agenerate_summary() - {document_id} - Summary generated successfully")
         return JSONResponse({
             'status'    : status.HTTP_200_OK,
             'type'      : 'text',
@@ -673,7 +761,7 @@ def generate_summary(document_id):
         })
 
     except Exception as e:
-        logger.error(f"FASTAPI Services Error - generate_summary() encountered an error: {e}")
+        logger.error(f"FASTAPI Services Error - agenerate_summary() encountered an error: {e}")
         return JSONResponse({
             'status'    : status.HTTP_500_INTERNAL_SERVER_ERROR,
             'type'      : 'string',
@@ -729,22 +817,41 @@ def save_response_to_db(document_id, question, response, token):
 
 # ============================== Handling Text based content ==============================
 
-def extract_pdf_elements(fpath, fname):
+def extract_pdf_elements(fpath, fname, report_stage = None):
     """ Extract images, tables, and chunk text from a PDF file """
     
     logger.info(f"FASTAPI Services - extract_pdf_elements() - Extracting contents from document {fname}")
+
+    pdf_file = os.path.join(fpath, fname)
+    image_output_dir = os.path.join(fpath, os.getenv("EXTRACTED_IMAGE_DIRECTORY"))
+    workers = int(os.getenv("PDF_PARTITION_WORKERS", 1))
+    pages_per_range = int(os.getenv("PDF_PARTITION_PAGES_PER_RANGE", 16))
+    classify_pages = os.getenv("PDF_PAGE_CLASSIFIER", "false").lower() == "true"
+
+    # Long PDFs are partitioned in page ranges across processes, and classified pages
+    # each get their own strategy, then the elements are chunked as one
+    if classify_pages or (workers > 1 and len(PyPDF2.PdfReader(pdf_file).pages) > pages_per_range):
+        elements, details = partition_pdf_in_ranges(
+            pdf_file,
+            image_output_dir,
+            starting_page_number    = 5,
+            workers                 = workers,
+            pages_per_range         = pages_per_range,
+            classify_pages          = classify_pages
+        )
+
+        if report_stage is not None:
+            report_stage("partitioning", details)
+
+        return chunk_by_title(elements, **CHUNKING_OPTIONS)
     
     return partition_pdf(
-        filename                        = os.path.join(fpath, fname),
+        filename                        = pdf_file,
         starting_page_number            = 5,
-        extract_images_in_pdf           = True,
-        extract_image_block_types       = ["Image", "Table"],
-        infer_table_structure           = True,
         chunking_strategy               = "by_title",
-        max_characters                  = 4000,
-        new_after_n_chars               = 3800,
-        combine_text_under_n_chars      = 2000,
-        extract_image_block_output_dir  = os.path.join(fpath, os.getenv("EXTRACTED_IMAGE_DIRECTORY")),
+        extract_image_block_output_dir  = image_output_dir,
+        **PARTITION_OPTIONS,
+        **CHUNKING_OPTIONS
     )
 
 def categorize_elements(raw_pdf_elements):
@@ -776,13 +883,13 @@ def preprocess_text(raw_text):
     return processed_text
 
 
-def chunk_pdf(fpath, fname):
+def chunk_pdf(fpath, fname, report_stage = None):
     """ Break down PDF contents into fixed sized chunks """
 
     logger.info(f"FASTAPI Services - chunk_pdf() - Chunking document {fname}")
     
     # Get elements
-    raw_pdf_elements = extract_pdf_elements(fpath, fname)
+    raw_pdf_elements = extract_pdf_elements(fpath, fname, report_stage)
 
     # Get text, tables
     texts, tables = categorize_elements(raw_pdf_elements)
@@ -790,6 +897,14 @@ def chunk_pdf(fpath, fname):
     # Remove irrelevant characters to avoid tokenizing issues
     # texts = preprocess_text(texts)
 
+    texts_4k_token = split_text_chunks(texts)
+
+    return texts, tables, texts_4k_token
+
+
+def split_text_chunks(texts):
+    """ Re-split the by-title texts into the fixed size chunks that are indexed """
+
     # Enforce a specific token size for texts
     # Use tiktoken for tokenizing
     text_splitter = RecursiveCharacterTextSplitter(
@@ -802,9 +917,7 @@ def chunk_pdf(fpath, fname):
     joined_texts = " ".join(texts)
     
     texts_4k_token = text_splitter.split_text(joined_texts)
-    texts_4k_token = preprocess_text(texts_4k_token)
-
-    return texts, tables, texts_4k_token
+    return preprocess_text(texts_4k_token)
 
 def generate_text_summaries(texts, tables, summarize_texts=False):
     """ Summarize text elements if needed """
@@ -852,34 +965,49 @@ def encode_image(image_path):
         return base64.b64encode(image_file.read()).decode("utf-8")
 
 
-def image_summarize(img_base64, prompt):
-    """ Ask the LLM to generate a summary of the image """
+# Shared captioning model, reused by every image of every document
+_caption_model = None
+_caption_model_lock = threading.Lock()
 
-    logger.info(f"FASTAPI Services - image_summarize() - Summarizing images")    
-    
-    chat = ChatOpenAI(
-        model       = "gpt-4o", 
-        max_tokens  = 1024,
-        api_key     = os.getenv("OPENAI_API")
-    )
 
-    msg = chat.invoke(
-        [
-            HumanMessage(
-                content=[
-                    {
-                        "type": "text", 
-                        "text": prompt
-                    },
-                    {
-                        "type"      : "image_url",
-                        "image_url" : {"url": f"data:image/jpeg;base64,{img_base64}"},
-                    },
-                ]
+def get_caption_model():
+    """ Return the process-wide image captioning model, with a per-image timeout and retries """
+
+    global _caption_model
+
+    with _caption_model_lock:
+        if _caption_model is None:
+            _caption_model = ChatOpenAI(
+                model       = "gpt-4o", 
+                max_tokens  = 1024,
+                api_key     = os.getenv("OPENAI_API"),
+                timeout     = float(os.getenv("IMAGE_CAPTION_TIMEOUT", 60)),
+                max_retries = 0
+            ).with_retry(
+                stop_after_attempt      = int(os.getenv("IMAGE_CAPTION_RETRIES", 2)) + 1,
+                wait_exponential_jitter = True
             )
-        ]
-    )
-    return msg.content
+
+    return _caption_model
+
+
+def image_caption_message(img_base64, prompt):
+    """ Build the vision prompt for one image """
+
+    return [
+        HumanMessage(
+            content=[
+                {
+                    "type": "text", 
+                    "text": prompt
+                },
+                {
+                    "type"      : "image_url",
+                    "image_url" : {"url": f"data:image/jpeg;base64,{img_base64}"},
+                },
+            ]
+        )
+    ]
 
 
 def generate_img_summaries(path):
@@ -900,17 +1028,124 @@ def generate_img_summaries(path):
     Give a concise summary of the image that is well optimized for retrieval via RAGs."""
 
     # Apply to images
-    for img_file in sorted(os.listdir(path)):
-        if img_file.endswith(".jpg"):
-            
-            img_path = os.path.join(path, img_file)
-            base64_image = encode_image(img_path)
-            
-            img_base64_list.append(base64_image)
-            image_summaries.append(image_summarize(base64_image, prompt))
+    img_files = [img_file for img_file in sorted(os.listdir(path)) if img_file.endswith(".jpg")]
+
+    # Obvious logos, rules and blank crops never reach the vision model
+    if os.getenv("IMAGE_FILTER_ENABLED", "true").lower() == "true":
+        img_files, _ = screen_images(
+            path,
+            img_files,
+            min_width           = int(os.getenv("IMAGE_FILTER_MIN_WIDTH", 100)),
+            min_height          = int(os.getenv("IMAGE_FILTER_MIN_HEIGHT", 100)),
+            max_aspect_ratio    = float(os.getenv("IMAGE_FILTER_MAX_ASPECT_RATIO", 6.0)),
+            min_bytes           = int(os.getenv("IMAGE_FILTER_MIN_BYTES", 3072)),
+            min_entropy         = float(os.getenv("IMAGE_FILTER_MIN_ENTROPY", 1.0)),
+            max_pages           = int(os.getenv("IMAGE_FILTER_MAX_PAGES", 3))
+        )
+
+    # Figures reused across chapters are captioned, embedded and sent once, as their canonical image
+    if os.getenv("IMAGE_DEDUP_ENABLED", "true").lower() == "true":
+        img_files, _ = deduplicate_images(
+            path,
+            img_files,
+            max_distance        = int(os.getenv("IMAGE_DEDUP_MAX_DISTANCE", 6))
+        )
+
+    encoded_images = [encode_image(os.path.join(path, img_file)) for img_file in img_files]
+
+    # Caption the images concurrently, batch() keeps the results in input order
+    captions = get_caption_model().batch(
+        [image_caption_message(base64_image, prompt) for base64_image in encoded_images],
+        {"max_concurrency": int(os.getenv("IMAGE_CAPTION_CONCURRENCY", 8))},
+        return_exceptions = True
+    )
+
+    for img_file, base64_image, caption in zip(img_files, encoded_images, captions):
+
+        # An image that still fails after its retries is left out, the others are kept
+        if isinstance(caption, Exception):
+            logger.error(f"FASTAPI Services Error - generate_img_summaries() could not caption {img_file}: {caption}")
+            continue
+
+        # Logos and covers that got past the local screen are flagged by the model itself
+        if caption.content.strip().strip(".").upper() == "IRRELEVANT IMAGE":
+            logger.info(f"FASTAPI Services - generate_img_summaries() - Dropped {{'file': '{img_file}', 'reason': 'captioned as irrelevant', 'kept': False}}")
+            continue
+        
+        img_base64_list.append(base64_image)
+        image_summaries.append(caption.content)
+
+    logger.info(f"FASTAPI Services - generate_img_summaries() - Captioned {len(image_summaries)} of {len(img_files)} images")
 
     return img_base64_list, image_summaries
 
+def get_image_store_path(fpath):
+    """ Return the directory holding the binary image sidecars of a document """
+
+    return os.path.join(fpath, os.getenv("IMAGE_STORE_DIRECTORY", "image_store"))
+
+
+def get_rendition_sizes():
+    """ Return the configured (width, height) of the resized image renditions """
+
+    def parse_size(value):
+        width, height = value.lower().split("x")
+        return int(width), int(height)
+
+    return {
+        "llm"       : parse_size(os.getenv("IMAGE_RENDITION_LLM_SIZE", "1300x600")),
+        "thumbnail" : parse_size(os.getenv("IMAGE_RENDITION_THUMBNAIL_SIZE", "320x240"))
+    }
+
+
+def get_rendition_file(image_file, rendition = "full"):
+    """ Return the relative path of an image rendition, the full size image is the sidecar itself """
+
+    if rendition == "full":
+        return image_file
+
+    base, extension = os.path.splitext(image_file)
+    return f"{base}_{rendition}{extension}"
+
+
+def create_image_renditions(fpath, image_file):
+    """ Write the resized renditions of a sidecar image next to it """
+
+    sizes = get_rendition_sizes()
+
+    with Image.open(os.path.join(fpath, image_file)) as img:
+        img = img.convert("RGB")
+
+        # The LLM input keeps the exact size the prompt was tuned for
+        img.resize(sizes["llm"], Image.LANCZOS).save(os.path.join(fpath, get_rendition_file(image_file, "llm")), format = "JPEG")
+
+        # The thumbnail keeps the aspect ratio
+        thumbnail = img.copy()
+        thumbnail.thumbnail(sizes["thumbnail"], Image.LANCZOS)
+        thumbnail.save(os.path.join(fpath, get_rendition_file(image_file, "thumbnail")), format = "JPEG")
+
+
+def save_image_sidecars(fpath, img_base64_list, images_uuid_list):
+    """ Write each image as a binary file named after its id and return the relative paths """
+
+    image_store = get_image_store_path(fpath)
+    os.makedirs(image_store, exist_ok = True)
+
+    image_files = []
+    for image_id, img_base64 in zip(images_uuid_list, img_base64_list):
+        image_file = os.path.join(os.path.basename(image_store), image_id + ".jpg")
+        
+        with open(os.path.join(fpath, image_file), "wb") as file:
+            file.write(base64.b64decode(img_base64))
+
+        # Resize once at ingestion so the query path never processes images
+        create_image_renditions(fpath, image_file)
+        
+        image_files.append(image_file)
+
+    return image_files
+
+
 def save_preprocessed_context(fpath, json_file, texts, text_summaries, tables, table_summaries, img_base64_list, image_summaries):
     """ Save preprocessed PDF contents locally"""
 
@@ -920,16 +1155,21 @@ def save_preprocessed_context(fpath, json_file, texts, text_summaries, tables, t
     tables_uuid_list = [str(uuid.uuid4()) for _ in tables]
     images_uuid_list = [str(uuid.uuid4()) for _ in img_base64_list]
 
+    # Images are kept as binary sidecars, the JSON only references them by id
+    image_files = save_image_sidecars(fpath, img_base64_list, images_uuid_list)
+
     data = {
         "texts"             : texts,
+        "texts_are_chunks"  : True,
         "text_summaries"    : text_summaries,
         "texts_uuid_list"   : texts_uuid_list,
         "tables"            : tables,
         "table_summaries"   : table_summaries,
         "tables_uuid_list"  : tables_uuid_list,
-        "img_base64_list"   : img_base64_list,
+        "image_files"       : image_files,
         "image_summaries"   : image_summaries,
-        "images_uuid_list"  : images_uuid_list
+        "images_uuid_list"  : images_uuid_list,
+        "rendition_sizes"   : get_rendition_sizes()
     }
 
     output_path = os.path.join(fpath, json_file)
@@ -937,6 +1177,284 @@ def save_preprocessed_context(fpath, json_file, texts, text_summaries, tables, t
     with open(output_path, "w") as file:
         json.dump(data, file, indent = 4)
 
+
+def load_preprocessed_context(fpath, json_file):
+    """ Load the preprocessed PDF contents, migrating inline base64 images to sidecars """
+
+    logger.info(f"FASTAPI Services - load_preprocessed_context() - Loading preprocessed contents")
+
+    output_path = os.path.join(fpath, json_file)
+
+    with open(output_path, "r") as file:
+        data = json.load(file)
+
+    migrated = False
+
+    # Older files carry the images inline, move them out once
+    if "img_base64_list" in data:
+        logger.info(f"FASTAPI Services - load_preprocessed_context() - Migrating inline images to sidecar files")
+        
+        data["image_files"] = save_image_sidecars(fpath, data.pop("img_base64_list"), data["images_uuid_list"])
+        migrated = True
+
+    # Older files store the by-title texts, while the summaries were made from the 4k chunks.
+    # The split is deterministic, and the first ids keep pointing at the same summaries
+    if not data.get("texts_are_chunks"):
+        logger.info(f"FASTAPI Services - load_preprocessed_context() - Migrating texts to the indexed 4k chunks")
+
+        texts = split_text_chunks(data["texts"])
+        data["texts"] = texts
+        data["texts_uuid_list"] = data["texts_uuid_list"][:len(texts)] + [str(uuid.uuid4()) for _ in range(len(texts) - len(data["texts_uuid_list"]))]
+        data["texts_are_chunks"] = True
+        migrated = True
+
+    # Renditions are rebuilt when the configured sizes change, and created once for older sidecars
+    rendition_sizes = {rendition: list(size) for rendition, size in get_rendition_sizes().items()}
+    resized = data.get("rendition_sizes") != rendition_sizes
+
+    if resized:
+        logger.info(f"FASTAPI Services - load_preprocessed_context() - Rendition sizes changed from {data.get('rendition_sizes')} to {rendition_sizes}, regenerating renditions")
+
+    for image_file in data["image_files"]:
+        if resized or not all(os.path.isfile(os.path.join(fpath, get_rendition_file(image_file, rendition))) for rendition in rendition_sizes):
+            create_image_renditions(fpath, image_file)
+
+    if resized:
+        data["rendition_sizes"] = rendition_sizes
+        migrated = True
+
+    if migrated:
+        with open(output_path, "w") as file:
+            json.dump(data, file, indent = 4)
+
+    return data
+
+
+def get_embeddings():
+    """ Return the process-wide embedding client, every embedding call goes through the cache """
+
+    global _embeddings
+
+    if _embeddings is None:
+        _embeddings = CachedEmbeddings(
+            underlying  = OpenAIEmbeddings(
+                model   = EMBEDDING_MODEL,
+                api_key = os.getenv("OPENAI_API")
+            ),
+            model       = EMBEDDING_MODEL,
+            cache       = embedding_cache,
+            query_cache = query_embedding_cache
+        )
+
+    return _embeddings
+
+
+def get_vector_store_path():
+    """ Return the directory of the corpus-wide vectorstores """
+
+    return os.path.join(os.getcwd(), os.getenv("VECTOR_STORE_DIRECTORY", "vectorstore"))
+
+
+# Lock file held for the life of the process that owns the local vectorstore directory
+_vector_store_owner = None
+
+
+def get_chroma_client():
+    """ Return the Chroma client of the shared collections, a Chroma server when CHROMA_HOST is set """
+
+    global _vector_store_owner
+
+    # Several worker processes share the collections through one Chroma server
+    if os.getenv("CHROMA_HOST"):
+        return chromadb.HttpClient(host = os.getenv("CHROMA_HOST"), port = int(os.getenv("CHROMA_PORT", 8000)))
+
+    # The local client only supports a single process, so a second worker fails at once
+    # instead of writing to an HNSW index the first one never sees
+    vector_store_path = get_vector_store_path()
+    os.makedirs(vector_store_path, exist_ok = True)
+
+    if fcntl is not None and _vector_store_owner is None:
+        owner = open(os.path.join(vector_store_path, ".owner.lock"), "w")
+        
+        try:
+            fcntl.flock(owner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        
+        except BlockingIOError:
+            owner.close()
+            raise RuntimeError(
+                f"The local vectorstore {vector_store_path} is open in another process. "
+                "Run a single worker, or set CHROMA_HOST to share a Chroma server between workers."
+            )
+        
+        _vector_store_owner = owner
+
+    return chromadb.PersistentClient(path = vector_store_path)
+
+
+def get_vectorstore(kind):
+    """ Return the shared full_text or report collection, opened once per process """
+
+    with _vectorstores_lock:
+        if kind not in _vectorstores:
+            if kind == "report":
+                collection_name = os.getenv("REPORT_COLLECTION", "report_collection")
+            else:
+                collection_name = os.getenv("FULL_TEXT_COLLECTION", "full_text_collection")
+
+            logger.info(f"FASTAPI Services - get_vectorstore() - Opening the {collection_name} collection")
+            _vectorstores[kind] = Chroma(
+                collection_name     = collection_name,
+                embedding_function  = get_embeddings(),
+                client              = get_chroma_client()
+            )
+
+    return _vectorstores[kind]
+
+
+def has_document_vectors(vectorstore, document_id):
+    """ Whether the shared collection holds any vector of the document """
+
+    return bool(vectorstore.get(where = {"document_id": document_id}, limit = 1, include = [])["ids"])
+
+
+def delete_document_vectors(document_id):
+    """ Delete every vector of a document from the shared full text and report collections """
+
+    logger.info(f"FASTAPI Services - delete_document_vectors() - Deleting the vectors of document {document_id}")
+
+    for kind in ("full_text", "report"):
+        get_vectorstore(kind)._collection.delete(where = {"document_id": document_id})
+
+
+def migrate_legacy_vectorstore(fpath, database_name, collection_name, vectorstore, document_id, manifest_path = None):
+    """ Move the vectors of a per-document Chroma store into the shared collection """
+
+    legacy_directory = os.path.join(fpath, database_name)
+
+    if not os.path.isdir(legacy_directory):
+        return
+
+    logger.info(f"FASTAPI Services - migrate_legacy_vectorstore() - Moving {database_name} into the shared collection")
+
+    # Stored embeddings are copied as-is, nothing is embedded again
+    legacy_vectorstore = Chroma(collection_name = collection_name, persist_directory = legacy_directory)
+    records = legacy_vectorstore.get(include = ["embeddings", "documents", "metadatas"])
+
+    # Repeated builds added the same chunk several times under random ids: keep one vector
+    # per doc_id, stored under that id, and drop the raw content the metadata used to carry
+    migrated = {}
+    for record_id, embedding, text, metadata in zip(records["ids"], records["embeddings"], records["documents"], records["metadatas"]):
+        metadata = {key: value for key, value in (metadata or {}).items() if key != "content"}
+        doc_id = metadata.get("doc_id", record_id)
+
+        if doc_id not in migrated:
+            migrated[doc_id] = (embedding, text, {**metadata, "document_id": document_id})
+
+    doc_ids = list(migrated)
+    for start in range(0, len(doc_ids), 1000):
+        batch = doc_ids[start:start + 1000]
+        vectorstore._collection.upsert(
+            ids         = batch,
+            embeddings  = [migrated[doc_id][0] for doc_id in batch],
+            documents   = [migrated[doc_id][1] for doc_id in batch],
+            metadatas   = [migrated[doc_id][2] for doc_id in batch]
+        )
+
+    logger.info(f"FASTAPI Services - migrate_legacy_vectorstore() - Moved {len(doc_ids)} of {len(records['ids'])} vectors, duplicates dropped")
+
+    # The migrated chunks are already embedded, so the next build does not embed them again
+    if manifest_path:
+        manifest = load_index_manifest(manifest_path)
+        manifest["indexed_ids"] = sorted(set(manifest["indexed_ids"]) | set(doc_ids))
+        save_index_manifest(manifest_path, manifest)
+
+    shutil.rmtree(legacy_directory, ignore_errors = True)
+
+
+def get_index_manifest_path(fpath, document_id):
+    """ Return the path of the index manifest kept next to the full text database """
+
+    return os.path.join(fpath, document_id + "_index_manifest.json")
+
+
+def load_index_manifest(manifest_path):
+    """ Load the index manifest, or an empty one if the document was never indexed """
+
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, "r") as file:
+            return json.load(file)
+
+    return {
+        "embedding_model"   : EMBEDDING_MODEL,
+        "indexed_ids"       : []
+    }
+
+
+def save_index_manifest(manifest_path, manifest):
+    """ Atomically write the index manifest to disk """
+
+    temp_path = manifest_path + ".tmp"
+
+    with open(temp_path, "w") as file:
+        json.dump(manifest, file, indent = 4)
+
+    os.replace(temp_path, manifest_path)
+
+
+def create_document_store(fpath, document_id):
+    """ Create a file-backed docstore holding the raw texts, tables and images of a document """
+
+    logger.info(f"FASTAPI Services - create_document_store() - Opening the docstore for document {document_id}")
+
+    def deserialize(value):
+        record = json.loads(value.decode("utf-8"))
+
+        # Images are returned as a typed reference, their bytes are only read
+        # when a rendition is actually needed
+        if record["type"] == "image":
+            return Document(
+                page_content    = "",
+                metadata        = {
+                    "type"          : "image",
+                    "image_file"    : os.path.join(fpath, record["path"])
+                }
+            )
+        
+        return Document(
+            page_content    = record["content"],
+            metadata        = {"type": record["type"]}
+        )
+
+    # One file per chunk id, read back only when the retriever asks for it
+    return EncoderBackedStore(
+        store               = LocalFileStore(os.path.join(fpath, document_id + "_docstore")),
+        key_encoder         = lambda key: key,
+        value_serializer    = lambda value: json.dumps(value).encode("utf-8"),
+        value_deserializer  = deserialize
+    )
+
+
+def get_retrieval_mode():
+    """ Return the retrieval mode: hybrid (vector + BM25), vector or lexical """
+
+    return os.getenv("RETRIEVAL_MODE", "hybrid")
+
+
+def load_lexical_index(fpath, document_id, doc_ids, texts):
+    """ Load the BM25 index of a document, building and saving it on first use """
+
+    index_path = os.path.join(fpath, document_id + "_bm25.npz")
+
+    if os.path.isfile(index_path):
+        return BM25Index.load(index_path)
+
+    logger.info(f"FASTAPI Services - load_lexical_index() - Building the BM25 index for document {document_id}")
+    lexical_index = BM25Index.build(doc_ids, texts)
+    lexical_index.save(index_path)
+    
+    return lexical_index
+
+
 def create_multi_vector_retriever(
     vectorstore, 
     text_summaries, 
@@ -947,14 +1465,17 @@ def create_multi_vector_retriever(
     tables_uuid_list, 
     image_summaries, 
     images, 
-    images_uuid_list
+    images_uuid_list,
+    docstore,
+    manifest_path = None,
+    document_id = None
 ):
     """ Create retriever that indexes summaries, but returns raw images or texts """
 
     logger.info(f"FASTAPI Services - create_multi_vector_retriever() - Creating a MultiVector Retriever")
 
-    # Initialize the storage layer
-    store = InMemoryStore()
+    # The storage layer is the file-backed docstore of the document
+    store = docstore
     id_key = "doc_id"
 
     # Create the multi-vector retriever to fetch 'k' similar documents
@@ -963,27 +1484,60 @@ def create_multi_vector_retriever(
         docstore        = store,
         id_key          = id_key,
         search_type     = "similarity",
-        search_kwargs   = {"k": 6}
+        search_kwargs   = {"k": 6, "filter": {"document_id": document_id}} if document_id else {"k": 6}
     )
 
+    # Chunk ids already embedded in the persisted collection
+    manifest = load_index_manifest(manifest_path) if manifest_path else {"indexed_ids": []}
+
+    # Collections indexed before the manifest existed are read once to seed it
+    if manifest_path and not os.path.isfile(manifest_path):
+        records = vectorstore.get(where = {"document_id": document_id} if document_id else None, include = ["metadatas"])
+        manifest["indexed_ids"] = sorted({metadata[id_key] for metadata in records["metadatas"] if metadata and id_key in metadata})
+
+        if manifest["indexed_ids"]:
+            logger.info(f"FASTAPI Services - create_multi_vector_retriever() - Seeded the index manifest with {len(manifest['indexed_ids'])} existing chunks")
+            save_index_manifest(manifest_path, manifest)
+
+    indexed_ids = set(manifest["indexed_ids"])
+
+    # Chunk ids already written to the docstore
+    stored_ids = set(store.yield_keys())
+
     # Helper function to add documents to the vectorstore and docstore
     def add_documents(retriever, doc_summaries, doc_contents, doc_uuids):
         
         doc_ids = doc_uuids
-        summary_docs = [
-            Document(
-                page_content    = s, 
-                metadata        = {
-                    "doc_id"    : doc_ids[i],
-                    # Store the original content in metadata
-                    "content"   : doc_contents[i]
-                }
-            )
-            for i, s in enumerate(doc_summaries)
-        ]
-        
-        retriever.vectorstore.add_documents(summary_docs)
-        retriever.docstore.mset(list(zip(doc_ids, doc_contents)))
+
+        # Only embed the summaries that are not in the collection yet
+        missing = [i for i, doc_id in enumerate(doc_ids) if doc_id not in indexed_ids]
+
+        if missing:
+            logger.info(f"FASTAPI Services - create_multi_vector_retriever() - Indexing {len(missing)} new chunks")
+            summary_docs = [
+                Document(
+                    page_content    = doc_summaries[i], 
+                    # The original content lives in the docstore only
+                    metadata        = {
+                        "doc_id"        : doc_ids[i],
+                        "type"          : doc_contents[i]["type"],
+                        **({"document_id": document_id} if document_id else {})
+                    }
+                )
+                for i in missing
+            ]
+            
+            # Chunk ids double as vector ids so a re-run upserts instead of duplicating
+            retriever.vectorstore.add_documents(summary_docs, ids = [doc_ids[i] for i in missing])
+            indexed_ids.update(doc_ids[i] for i in missing)
+
+            if manifest_path:
+                manifest["indexed_ids"] = sorted(indexed_ids)
+                save_index_manifest(manifest_path, manifest)
+
+        retriever.docstore.mset([
+            (doc_id, doc_contents[i]) for i, doc_id in enumerate(doc_ids) if doc_id not in stored_ids
+        ])
 
     # Add texts, tables, and images
     
@@ -1001,7 +1555,7 @@ def create_multi_vector_retriever(
 
     return retriever
 
-def save_report_vectorstore(report_vectorstore, response):
+def save_report_vectorstore(report_vectorstore, response, document_id):
     """ Add the report response to vectorstore if prompt_type is 'report' """
 
     logger.info(f"FASTAPI Services - save_report_vectorstore() - Saving embeddings to report vector store")
@@ -1009,87 +1563,39 @@ def save_report_vectorstore(report_vectorstore, response):
     report_doc = Document(
         page_content = response,
         metadata = {
-            "doc_id"    : str(uuid.uuid4()),
-            "doc_type"  : "report"
+            "doc_id"        : str(uuid.uuid4()),
+            "document_id"   : document_id,
+            "doc_type"      : "report"
         }
     )
     
     report_vectorstore.add_documents([report_doc])
 
-def create_report_retriever(report_vectorstore):
-    """ Create a retriever for the vectorstore """
+def create_report_retriever(report_vectorstore, document_id):
+    """ Create a retriever over the reports of a document """
 
     logger.info(f"FASTAPI Services - create_report_retriever() - Creating a retriever for report vector store")
 
     return report_vectorstore.as_retriever(
         search_type     = "similarity",
-        search_kwargs   = {'k':3}
+        search_kwargs   = {'k':3, 'filter': {'document_id': document_id}}
     )
 
-def looks_like_base64(sb):
-    """Check if the string looks like base64"""
-    
-    return re.match("^[A-Za-z0-9+/]+[=]{0,2}$", sb) is not None
-
-
-def is_image_data(b64data):
-    """ Check if the base64 data is an image by looking at the start of the data """
-    
-    image_signatures = {
-        b"\xff\xd8\xff"                     : "jpg",
-        b"\x89\x50\x4e\x47\x0d\x0a\x1a\x0a" : "png",
-        b"\x47\x49\x46\x38"                 : "gif",
-        b"\x52\x49\x46\x46"                 : "webp",
-    }
-    
-    try:
-        # Decode and get the first 8 bytes
-        header = base64.b64decode(b64data)[:8]  
-        
-        for sig, format in image_signatures.items():
-            if header.startswith(sig):
-                return True
-        
-        return False
-    
-    except Exception as exception:
-        print(exception)
-        return False
-
-
-def resize_base64_image(base64_string, size=(128, 128)):
-    """ Resize an image encoded as a Base64 string """
-    
-    # Decode the Base64 string
-    img_data = base64.b64decode(base64_string)
-    img = Image.open(io.BytesIO(img_data))
-
-    # Resize the image
-    resized_img = img.resize(size, Image.LANCZOS)
-
-    # Save the resized image to a bytes buffer
-    buffered = io.BytesIO()
-    resized_img.save(buffered, format=img.format)
-
-    # Encode the resized image to Base64
-    return base64.b64encode(buffered.getvalue()).decode("utf-8")
-
-
-def split_image_text_types(docs):
-    """ Split base64-encoded images and texts """
+def split_image_text_types(docs):
+    """ Split images and texts using the type assigned at ingestion """
     
     b64_images = []
     texts = []
     
     for doc in docs:
         
-        # Check if the document is of type Document and extract page_content if so
+        # Documents without a type (e.g. saved reports) are plain text
         if isinstance(doc, Document):
-            doc = doc.page_content
-        
-        if looks_like_base64(doc) and is_image_data(doc):
-            doc = resize_base64_image(doc, size=(1300, 600))
-            b64_images.append(doc)
+            if doc.metadata.get("type") == "image":
+                # Images already come out of ingestion at the LLM rendition size
+                b64_images.append(encode_image(get_rendition_file(doc.metadata["image_file"], "llm")))
+            else:
+                texts.append(doc.page_content)
         
         else:
             texts.append(doc)
@@ -1154,8 +1660,8 @@ def img_prompt_func(data_dict, prompt_type = "default"):
     
     return [HumanMessage(content = messages)]
 
-def multi_modal_rag_chain(retriever, prompt_type = "default", max_tokens = 1024):
-    """ Multi-modal RAG chain with configurable prompt type """
+def multi_modal_rag_chain(prompt_type = "default", max_tokens = 1024):
+    """ Multi-modal RAG chain with configurable prompt type, fed with already retrieved documents """
 
     logger.info(f"FASTAPI Services - multi_modal_rag_chain() - Setting up the RAG chain")
     
@@ -1177,11 +1683,11 @@ def multi_modal_rag_chain(retriever, prompt_type = "default", max_tokens = 1024)
     # Lambda function that includes both data_dict and prompt_type
     prompt_func = lambda data_dict: img_prompt_func(data_dict, prompt_type = prompt_type)
 
-    # RAG pipeline
+    # RAG pipeline, invoked with {"docs": [...], "question": "..."} so retrieval happens only once
     chain = (
         {
-            "context"   : retriever | RunnableLambda(split_image_text_types),
-            "question"  : RunnablePassthrough(),
+            "context"   : RunnableLambda(lambda inputs: inputs["docs"]) | RunnableLambda(split_image_text_types),
+            "question"  : RunnableLambda(lambda inputs: inputs["question"]),
         }
         | RunnableLambda(prompt_func)
         | model
@@ -1191,45 +1697,156 @@ def multi_modal_rag_chain(retriever, prompt_type = "default", max_tokens = 1024)
     return chain
 
 
-def invoke_pipeline(document_id, question, prompt_type, source, token):
+def get_cache_stats():
+    """ Report the counters of the process-wide caches """
 
-    logger.info(f"FASTAPI Services - img_prompt_func() - Initiating RAG pipeline")
+    logger.info(f"FASTAPI Services - get_cache_stats() - Collecting cache statistics")
 
-    # Find the PDF document in the directory of document_id
-    fpath = os.path.join(os.getcwd(), os.getenv("DOWNLOAD_DIRECTORY", "downloads") , document_id)
+    return JSONResponse({
+        'status'    : status.HTTP_200_OK,
+        'type'      : 'json',
+        'message'   : {
+            'retriever_registry'    : retriever_registry.stats(),
+            'embedding_cache'       : embedding_cache.stats(),
+            'query_embedding_cache' : query_embedding_cache.stats(),
+            'answer_cache'          : answer_cache.stats(),
+            'semantic_answer_cache' : semantic_answer_cache.stats()
+        }
+    })
+
+
+def invalidate_answer_caches(document_id, source = None):
+    """ Drop the exact and semantic cached answers of a document, only those of one source when given """
+
+    answer_cache.invalidate(document_id, source)
+    semantic_answer_cache.invalidate(document_id, source)
+
+
+class DocumentBuildInProgress(Exception):
+    """ Raised when another caller is still building the same document """
+
+
+# One build lock per document within this process
+_build_locks = {}
+_build_locks_guard = threading.Lock()
+
+
+def get_document_path(document_id):
+    """ Return the local directory of a document """
+
+    return os.path.join(os.getcwd(), os.getenv("DOWNLOAD_DIRECTORY", "downloads") , document_id)
+
+
+@contextmanager
+def document_build_lock(document_id, timeout = None):
+    """ Single-flight guard for a document build, across threads and worker processes on this host """
+
+    if timeout is None:
+        timeout = float(os.getenv("DOCUMENT_BUILD_LOCK_TIMEOUT", 1800))
+    deadline = time.monotonic() + timeout
+
+    with _build_locks_guard:
+        lock = _build_locks.setdefault(document_id, threading.Lock())
+
+    if not lock.acquire(timeout = timeout):
+        raise DocumentBuildInProgress(document_id)
+
+    lock_file = None
+    try:
+        # Other worker processes coordinate through a lock file next to the document directory,
+        # which does not exist until the download is moved into place
+        if fcntl is not None:
+            document_path = get_document_path(document_id)
+            os.makedirs(os.path.dirname(document_path), exist_ok = True)
+            lock_file = open(os.path.join(os.path.dirname(document_path), f".{document_id}.build.lock"), "w")
+            
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise DocumentBuildInProgress(document_id)
+                    time.sleep(0.5)
+
+        yield
+
+    finally:
+        if lock_file is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+        lock.release()
+
+
+def indexing_response(document_id, job = None):
+    """ Fast 202 response returned while the document is being ingested """
+
+    return JSONResponse(
+        status_code = status.HTTP_202_ACCEPTED,
+        content     = {
+            'status'    : status.HTTP_202_ACCEPTED,
+            'type'      : 'json',
+            'message'   : {
+                "document_id"   : document_id,
+                "indexing"      : True,
+                "job"           : job
+            }
+        }
+    )
+
+
+def build_document_retrievers(document_id, report_stage = None):
+    """ Preprocess the document if needed and build its retrievers """
+
+    # Stage reporting is optional, ingestion jobs use it for progress
+    report_stage = report_stage or (lambda stage, details = None: None)
+
+    logger.info(f"FASTAPI Services - build_document_retrievers() - Building retrievers for document {document_id}")
+
+    # Builds run under the document lock, so the download is moved into place by a single caller
+    report_stage("downloading")
+    fpath = fetch_document_files(document_id)
     dir_contents = os.listdir(fpath)
-    
-    for file in dir_contents:
-        if file.endswith(".pdf"):
-            fname = file
-            break
 
-    # Define full_text vector database details
-    full_text_database_name = document_id + "_full_text_database"
-    full_text_collection_name = document_id + "_full_text_collection"
-    full_text_persistent_directory = os.path.join(fpath, full_text_database_name)
+    # Find the PDF document in the directory of document_id
+    fname = find_document_pdf(fpath)
+
+    # Every document shares the corpus-wide collections, filtered by document_id
+    full_text_vectorstore = get_vectorstore("full_text")
+    report_vectorstore = get_vectorstore("report")
 
-    # Define report vector database details
-    report_database_name = document_id + "_report_database"
-    report_collection_name = document_id + "_report_collection"
-    report_persistent_directory = os.path.join(fpath, report_database_name)
+    # Documents indexed before the shared collections keep their vectors
+    migrate_legacy_vectorstore(fpath, document_id + "_full_text_database", document_id + "_full_text_collection", full_text_vectorstore, document_id, get_index_manifest_path(fpath, document_id))
+    migrate_legacy_vectorstore(fpath, document_id + "_report_database", document_id + "_report_collection", report_vectorstore, document_id)
 
     # Save preprocessed contents to a json file
     preprocessed_json = os.getenv("PREPROCESSED_JSON_FILE")
 
-    # Check if the vector store and the json file already exist to avoid rebuilding
+    # Check if the vectors and the json file already exist to avoid rebuilding
     # the vector index
     json_exists = database_exists = False
 
     json_exists = preprocessed_json in dir_contents and os.path.isfile(os.path.join(fpath, preprocessed_json))
-    database_exists = full_text_database_name in dir_contents and os.path.isdir(os.path.join(fpath, full_text_database_name))
+    database_exists = has_document_vectors(full_text_vectorstore, document_id)
+
+    # Without the preprocessed contents the document is rebuilt from scratch. Vectors left in the shared
+    # collections point at docstore records that no longer exist, so they are deleted first
+    if not json_exists:
+        if database_exists:
+            delete_document_vectors(document_id)
+            database_exists = False
 
-    if not json_exists and not database_exists:
+        # Answers and retrievers built against an earlier index of this document are stale
+        invalidate_answer_caches(document_id)
+        retriever_registry.invalidate(document_id)
 
         # Partition and chunk the PDF
-        texts, tables, texts_4k_token = chunk_pdf(fpath, fname)
+        report_stage("partitioning")
+        texts, tables, texts_4k_token = chunk_pdf(fpath, fname, report_stage)
 
         # (OPTIONAL) Summarize the text content
+        report_stage("summarizing")
         text_summaries, table_summaries = generate_text_summaries(
             texts_4k_token, 
             tables, 
@@ -1237,52 +1854,43 @@ def invoke_pipeline(document_id, question, prompt_type, source, token):
         )
 
         # Generate summaries for the images
+        report_stage("captioning")
         img_base64_list, image_summaries = generate_img_summaries(os.path.join(fpath, os.getenv("EXTRACTED_IMAGE_DIRECTORY")))
 
         # Save all preprocessed data
-        save_preprocessed_context(fpath, preprocessed_json, texts, text_summaries, tables, table_summaries, img_base64_list, image_summaries)
+        report_stage("saving")
+        # The 4k chunks are what gets summarized, so they are also the stored text records
+        save_preprocessed_context(fpath, preprocessed_json, texts_4k_token, text_summaries, tables, table_summaries, img_base64_list, image_summaries)
 
-    file_path = os.path.join(fpath, preprocessed_json)
+        # A lexical index built over the previous ids no longer matches the docstore
+        lexical_index_path = os.path.join(fpath, document_id + "_bm25.npz")
+        if os.path.isfile(lexical_index_path):
+            os.remove(lexical_index_path)
 
-    text_summaries = texts = texts_uuid_list = []
-    table_summaries = tables = tables_uuid_list = [] 
-    image_summaries = img_base64_list = images_uuid_list = []
+    # A manifest without vectors in the collection is stale, so the index is rebuilt from scratch
+    manifest_path = get_index_manifest_path(fpath, document_id)
+    if not database_exists and os.path.isfile(manifest_path):
+        os.remove(manifest_path)
+        invalidate_answer_caches(document_id)
+        retriever_registry.invalidate(document_id)
 
-    with open(file_path, "r") as file:
-        data = json.load(file)
-        
-        texts = data["texts"]
-        text_summaries = data["text_summaries"]
-        texts_uuid_list = data["texts_uuid_list"]
-        
-        tables = data["tables"]
-        table_summaries = data["table_summaries"]
-        tables_uuid_list = data["tables_uuid_list"]
-        
-        img_base64_list = data["img_base64_list"]
-        image_summaries = data["image_summaries"]
-        images_uuid_list = data["images_uuid_list"]
+    data = load_preprocessed_context(fpath, preprocessed_json)
 
+    # Docstore records: texts and tables are stored inline, images by sidecar path
+    texts = [{"type": "text", "content": text} for text in data["texts"]]
+    text_summaries = data["text_summaries"]
+    texts_uuid_list = data["texts_uuid_list"]
     
-    # The full text vectorstore to use to index the summaries
-    full_text_vectorstore = Chroma(
-        collection_name     = full_text_collection_name, 
-        embedding_function  = OpenAIEmbeddings(
-            model   = "text-embedding-3-large",
-            api_key = os.getenv("OPENAI_API")
-        ),
-        persist_directory   = full_text_persistent_directory
-    )
+    tables = [{"type": "table", "content": table} for table in data["tables"]]
+    table_summaries = data["table_summaries"]
+    tables_uuid_list = data["tables_uuid_list"]
+    
+    images = [{"type": "image", "path": image_file} for image_file in data["image_files"]]
+    image_summaries = data["image_summaries"]
+    images_uuid_list = data["images_uuid_list"]
 
-    # The report vectorstore to index reports
-    report_vectorstore = Chroma(
-        collection_name     = report_collection_name, 
-        embedding_function  = OpenAIEmbeddings(
-            model   = "text-embedding-3-large",
-            api_key = os.getenv("OPENAI_API")
-        ),
-        persist_directory   = report_persistent_directory
-    )
+    # Index the summaries in the shared full text collection
+    report_stage("indexing")
 
     # Create full_text_retriever
     retriever_multi_vector_img = create_multi_vector_retriever(
@@ -1294,91 +1902,859 @@ def invoke_pipeline(document_id, question, prompt_type, source, token):
         tables,
         tables_uuid_list,
         image_summaries,
-        img_base64_list,
-        images_uuid_list
+        images,
+        images_uuid_list,
+        docstore = create_document_store(fpath, document_id),
+        manifest_path = manifest_path,
+        document_id = document_id
     )
 
+    # Newly indexed documents become searchable across the corpus right away
+    if not database_exists or document_id not in corpus_search_index:
+        refresh_corpus_search_document(full_text_vectorstore, document_id, announce = not database_exists)
+
     # Create report_retriever
-    retriever_report = create_report_retriever(report_vectorstore)
+    retriever_report = create_report_retriever(report_vectorstore, document_id)
+
+    # Lexical index over the raw texts, tables and image summaries, built once
+    lexical_index = load_lexical_index(
+        fpath,
+        document_id,
+        texts_uuid_list + tables_uuid_list + images_uuid_list,
+        data["texts"] + data["tables"] + image_summaries
+    )
 
-    try:
+    entry = {
+        "full_text_retriever"   : HybridRetriever(
+            vector_retriever    = retriever_multi_vector_img,
+            lexical_index       = lexical_index,
+            mode                = get_retrieval_mode(),
+            k                   = retriever_multi_vector_img.search_kwargs["k"]
+        ),
+        "report_retriever"      : retriever_report,
+        "report_vectorstore"    : report_vectorstore,
+        "docstore"              : retriever_multi_vector_img.docstore,
+        "lexical_index"         : lexical_index
+    }
+
+    # The docstore lives on disk, so only the lexical index is held in memory
+    size_bytes = lexical_index.nbytes
+
+    return entry, size_bytes
+
+
+def get_document_retrievers(document_id, report_stage = None):
+    """ Fetch the retrievers for a document from the registry, building them on a miss """
 
-        # Check retrieval
-        query = question
+    entry = retriever_registry.get(document_id)
 
-        if prompt_type == "report":
-            if source == "report":
-                # RAG chain for Q&A, with report_vectorstore as source
-                chain_multimodal_rag = multi_modal_rag_chain(retriever_report, prompt_type="report", max_tokens=2048)
-                docs = retriever_report.invoke(query)
+    if entry is None:
+        with document_build_lock(document_id):
             
-            else:
-                # RAG chain for generating reports, with full_text_vectorstore as source
-                chain_multimodal_rag = multi_modal_rag_chain(retriever_multi_vector_img, prompt_type="report", max_tokens=2048)
-                docs = retriever_multi_vector_img.invoke(query)
-
-        if prompt_type == "default":
-            if source == "report":
-                # Default Q&A RAG chain, with report_vectorstore as source
-                chain_multimodal_rag = multi_modal_rag_chain(retriever_report, prompt_type="default")
-                docs = retriever_report.invoke(query)
+            # Another caller may have finished the build while this one waited
+            entry = retriever_registry.get(document_id)
             
-            else:
-                # Default Q&A RAG chain, with full_text_vectorstore as source
-                chain_multimodal_rag = multi_modal_rag_chain(retriever_multi_vector_img, prompt_type="default")
-                docs = retriever_multi_vector_img.invoke(query)
-        
-        # Bundle the images
-        doc_limit = len(docs) if len(docs) < 3 else 3
-        images_retrieved = {
-            "length": 0,
-            "content": []
+            if entry is None:
+                entry, size_bytes = build_document_retrievers(document_id, report_stage)
+                retriever_registry.put(document_id, entry, size_bytes)
+                logger.info(f"FASTAPI Services - get_document_retrievers() - Registry stats: {retriever_registry.stats()}")
+
+    return entry
+
+
+def is_document_ingested(document_id):
+    """ Whether the preprocessed contents and the index manifest of a document exist """
+
+    fpath = get_document_path(document_id)
+    preprocessed_json = os.getenv("PREPROCESSED_JSON_FILE")
+
+    return (
+        os.path.isfile(os.path.join(fpath, preprocessed_json)) and
+        os.path.isfile(get_index_manifest_path(fpath, document_id))
+    )
+
+
+def ingest_document(document_id, report_stage):
+    """ Ingestion job: download the document, preprocess it and build its retrievers """
+
+    get_document_retrievers(document_id, report_stage)
+
+
+def pending_ingestion_job(document_id):
+    """ Return the ingestion job of a document that is not ready yet, queueing one if needed """
+
+    # Pick up documents re-indexed by other workers before trusting the registry
+    sync_corpus_search_index()
+
+    if ingestion_jobs.is_pending(document_id):
+        return ingestion_jobs.get(document_id)
+
+    if document_id in retriever_registry or is_document_ingested(document_id):
+        return None
+
+    return ingestion_jobs.submit(document_id, ingest_document)
+
+
+def submit_ingestion(document_id):
+    """ Queue the ingestion of a document """
+
+    logger.info(f"FASTAPI Services - submit_ingestion() - Queueing ingestion for document {document_id}")
+
+    try:
+        job = ingestion_jobs.submit(document_id, ingest_document)
+    
+    except IngestionQueueFull:
+        return JSONResponse({
+            'status'    : status.HTTP_503_SERVICE_UNAVAILABLE,
+            'type'      : 'string',
+            'message'   : 'The ingestion queue is full. Please retry later.'
+        })
+
+    return JSONResponse(
+        status_code = status.HTTP_202_ACCEPTED,
+        content     = {
+            'status'    : status.HTTP_202_ACCEPTED,
+            'type'      : 'json',
+            'message'   : job
+        }
+    )
+
+
+def get_ingestion_status(document_id):
+    """ Report the stage, progress and timings of the ingestion job of a document """
+
+    logger.info(f"FASTAPI Services - get_ingestion_status() - Fetching ingestion status for document {document_id}")
+
+    job = ingestion_jobs.get(document_id)
+
+    if job is None:
+        return JSONResponse({
+            'status'    : status.HTTP_404_NOT_FOUND,
+            'type'      : 'string',
+            'message'   : f"No ingestion job found for document_id {document_id}"
+        })
+
+    return JSONResponse({
+        'status'    : status.HTTP_200_OK,
+        'type'      : 'json',
+        'message'   : job
+    })
+
+
+# Progress of the startup warm-up, reported by the readiness endpoint
+warmup_state = {
+    "status"    : "pending",
+    "documents" : {}
+}
+_warmup_lock = threading.Lock()
+
+
+def get_hot_document_ids():
+    """ Return the configured hot-list, or the most queried documents from the research notes """
+
+    hot_list = [document_id.strip() for document_id in os.getenv("PREWARM_DOCUMENT_IDS", "").split(",") if document_id.strip()]
+    if hot_list:
+        return hot_list
+
+    top_documents = int(os.getenv("PREWARM_TOP_DOCUMENTS", 5))
+    if top_documents <= 0:
+        return []
+
+    logger.info(f"FASTAPI Services - get_hot_document_ids() - Fetching the {top_documents} most queried documents")
+    conn = create_connection_to_snowflake()
+
+    if conn is None:
+        return []
+
+    cursor = conn.cursor()
+    try:
+        query = """
+        SELECT document_id, COUNT(*) AS query_count FROM research_notes 
+        GROUP BY document_id ORDER BY query_count DESC LIMIT %s
+        """
+        cursor.execute(query, (top_documents,))
+        return [row[0] for row in cursor.fetchall()]
+
+    except Exception as e:
+        logger.error(f"FASTAPI Services Error - get_hot_document_ids() encountered an error: {e}")
+        return []
+
+    finally:
+        close_connection(conn, cursor)
+
+
+def set_warmup_status(document_id, document_status):
+    with _warmup_lock:
+        warmup_state["documents"][document_id] = document_status
+
+
+def prewarm_documents():
+    """ Download the hot documents and build their retrievers before the app reports ready """
+
+    with _warmup_lock:
+        warmup_state["status"] = "running"
+
+    document_ids = get_hot_document_ids()
+    logger.info(f"FASTAPI Services - prewarm_documents() - Warming up {len(document_ids)} documents")
+
+    for document_id in document_ids:
+        set_warmup_status(document_id, "pending")
+
+    queued = []
+    for document_id in document_ids:
+        try:
+            # Documents never ingested on this host are downloaded and built by the ingestion queue
+            if not is_document_ingested(document_id):
+                ingestion_jobs.submit(document_id, ingest_document)
+                set_warmup_status(document_id, "ingestion_queued")
+                queued.append(document_id)
+                continue
+
+            set_warmup_status(document_id, "building")
+            get_document_retrievers(document_id)
+            set_warmup_status(document_id, "warm")
+
+        except Exception as e:
+            logger.error(f"FASTAPI Services Error - prewarm_documents() encountered an error for {document_id}: {e}")
+            set_warmup_status(document_id, "failed")
+
+    # The pod only reports ready once the queued documents are ingested too
+    while queued:
+        time.sleep(float(os.getenv("PREWARM_POLL_SECONDS", 2)))
+
+        for document_id in [document_id for document_id in queued if not ingestion_jobs.is_pending(document_id)]:
+            queued.remove(document_id)
+            job = ingestion_jobs.get(document_id)
+
+            if job is None or job["status"] != "complete":
+                logger.error(f"FASTAPI Services Error - prewarm_documents() - Ingestion failed for {document_id}: {job and job['error']}")
+                set_warmup_status(document_id, "failed")
+                continue
+
+            # The job may have run on another worker, so the retrievers are built into this registry
+            try:
+                set_warmup_status(document_id, "building")
+                get_document_retrievers(document_id)
+                set_warmup_status(document_id, "warm")
+
+            except Exception as e:
+                logger.error(f"FASTAPI Services Error - prewarm_documents() encountered an error for {document_id}: {e}")
+                set_warmup_status(document_id, "failed")
+
+    with _warmup_lock:
+        warmup_state["status"] = "complete"
+
+    logger.info(f"FASTAPI Services - prewarm_documents() - Warm-up complete")
+
+
+def get_readiness():
+    """ Report whether the startup warm-up has finished """
+
+    with _warmup_lock:
+        documents = dict(warmup_state["documents"])
+        ready = warmup_state["status"] == "complete"
+
+    http_status = status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE
+
+    return JSONResponse(
+        status_code = http_status,
+        content     = {
+            'status'    : http_status,
+            'type'      : 'json',
+            'message'   : {
+                "ready"     : ready,
+                "warmed"    : sum(1 for document_status in documents.values() if document_status == "warm"),
+                "total"     : len(documents),
+                "documents" : documents,
+                "search"    : corpus_search_index.stats()
+            }
         }
+    )
+
+
+# Titles of the publications, shown in the corpus search results
+publication_titles = {}
+
+
+def fetch_publication_titles():
+    """ Load the title of every publication, keyed by document_id """
+
+    logger.info(f"FASTAPI Services - fetch_publication_titles() - Fetching the publication titles")
+    conn = create_connection_to_snowflake()
+
+    if conn is None:
+        return
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT document_id, title FROM publications_info")
+        publication_titles.update({row[0]: row[1] for row in cursor.fetchall()})
+
+    except Exception as e:
+        logger.error(f"FASTAPI Services Error - fetch_publication_titles() encountered an error: {e}")
+
+    finally:
+        close_connection(conn, cursor)
+
+
+# Worker processes announce the documents they index in a log next to the shared collections,
+# so the others can add them to their own corpus search index
+_corpus_log_offset = 0
+_corpus_log_lock = threading.Lock()
+
+
+def get_corpus_log_path():
+    """ Return the log of documents indexed into the shared full text collection """
+
+    return os.path.join(get_vector_store_path(), "indexed_documents.log")
+
+
+def announce_corpus_search_document(document_id):
+    """ Tell the other worker processes that a document was indexed """
+
+    # Appends of a single short line are not interleaved between processes
+    with open(get_corpus_log_path(), "a") as file:
+        file.write(f"{os.getpid()} {document_id}\n")
+
+
+def sync_corpus_search_index():
+    """ Add the documents indexed by other worker processes since the last sync """
+
+    global _corpus_log_offset
+
+    try:
+        if os.path.getsize(get_corpus_log_path()) <= _corpus_log_offset:
+            return
+
+        with _corpus_log_lock:
+            with open(get_corpus_log_path(), "rb") as file:
+                file.seek(_corpus_log_offset)
+                
+                # A line still being written is read on the next sync
+                data = file.read()
+                data = data[:data.rfind(b"\n") + 1]
+            _corpus_log_offset += len(data)
+
+        document_ids = [
+            document_id for pid, document_id in (line.split(" ", 1) for line in data.decode("utf-8").splitlines())
+            if pid != str(os.getpid())
+        ]
+
+        for document_id in dict.fromkeys(document_ids):
+            logger.info(f"FASTAPI Services - sync_corpus_search_index() - Adding document {document_id} indexed by another worker")
+            refresh_corpus_search_document(get_vectorstore("full_text"), document_id, announce = False)
+
+            # Retrievers this worker built before the other one re-indexed the document are stale
+            retriever_registry.invalidate(document_id)
+
+    except FileNotFoundError:
+        return
+
+    except Exception as e:
+        logger.error(f"FASTAPI Services Error - sync_corpus_search_index() encountered an error: {e}")
+
+
+def load_corpus_search_index():
+    """ Read the shared full text collection into the in-memory corpus search index, retrying with backoff """
+
+    global _corpus_log_offset
+
+    delay = float(os.getenv("SEARCH_LOAD_RETRY_SECONDS", 5))
+
+    while True:
+        logger.info(f"FASTAPI Services - load_corpus_search_index() - Loading the corpus search index")
+
+        try:
+            # Documents announced before the collection is read are part of it
+            with _corpus_log_lock:
+                log_path = get_corpus_log_path()
+                _corpus_log_offset = os.path.getsize(log_path) if os.path.isfile(log_path) else 0
+
+            fetch_publication_titles()
+            vectorstore = get_vectorstore("full_text")
+            records = {"documents": [], "embeddings": [], "metadatas": []}
+
+            # Page through the collection to bound the size of each read
+            offset = 0
+            while True:
+                page = vectorstore.get(include = ["documents", "embeddings", "metadatas"], limit = 1000, offset = offset)
+                if not len(page["ids"]):
+                    break
+
+                for key in records:
+                    records[key].extend(page[key])
+                offset += len(page["ids"])
+
+            corpus_search_index.load(records)
+            return
+
+        except Exception as e:
+            logger.error(f"FASTAPI Services Error - load_corpus_search_index() encountered an error, retrying in {delay:.0f}s: {e}")
+            corpus_search_index.mark_load_failed(str(e))
+
+        time.sleep(delay)
+        delay = min(delay * 2, float(os.getenv("SEARCH_LOAD_MAX_RETRY_SECONDS", 300)))
+
+
+def refresh_corpus_search_document(vectorstore, document_id, announce = True):
+    """ Replace the chunks of a freshly indexed document in the corpus search index """
+
+    records = vectorstore.get(where = {"document_id": document_id}, include = ["documents", "embeddings"])
+    corpus_search_index.set_document(document_id, records["documents"], records["embeddings"])
+
+    if announce:
+        announce_corpus_search_document(document_id)
+
+    if document_id not in publication_titles:
+        fetch_publication_titles()
+
+
+def search_corpus(query, k, mode):
+    """ Rank the ingested documents for a query, with titles and matching snippets """
+
+    logger.info(f"FASTAPI Services - search_corpus() - Searching the corpus")
+
+    if not corpus_search_index.loaded:
+        load_error = corpus_search_index.stats()["load_error"]
+        return JSONResponse(
+            status_code = status.HTTP_503_SERVICE_UNAVAILABLE,
+            content     = {
+                'status'    : status.HTTP_503_SERVICE_UNAVAILABLE,
+                'type'      : 'string',
+                'message'   : 'The search index failed to load and is being retried.' if load_error else 'The search index is still loading. Please retry shortly.'
+            }
+        )
+
+    # Documents ingested by the other workers become searchable here too
+    sync_corpus_search_index()
+
+    # Without a query vector the search falls back to the lexical index
+    query_vector = embed_question(query) if mode != "lexical" else None
+    lexical = mode != "vector" or query_vector is None
+
+    results = corpus_search_index.search(query, query_vector, k, lexical)
+    for result in results:
+        result["title"] = publication_titles.get(result["document_id"])
+
+    return JSONResponse({
+        'status'    : status.HTTP_200_OK,
+        'type'      : 'json',
+        'message'   : results,
+        'length'    : len(results)
+    })
+
+
+def embed_question(question):
+    """ Embed the question for the semantic cache, None in lexical mode or when the provider fails """
+
+    if get_retrieval_mode() == "lexical":
+        return None
+
+    try:
+        return get_embeddings().embed_query(question)
+    
+    except Exception as e:
+        logger.warning(f"FASTAPI Services - embed_question() - Embedding failed, skipping the semantic cache: {e}")
+        return None
+
+
+async def aembed_question(question):
+    """ Async variant of embed_question """
+
+    if get_retrieval_mode() == "lexical":
+        return None
+
+    try:
+        return await get_embeddings().aembed_query(question)
+    
+    except Exception as e:
+        logger.warning(f"FASTAPI Services - aembed_question() - Embedding failed, skipping the semantic cache: {e}")
+        return None
+
+
+async def alookup_cached_answer(document_id, question, prompt_type, source):
+    """ Look for an exact or semantic cached answer, returning it with the cache decision and the question vector """
+
+    # Serve repeated questions straight from the answer cache, before paying for an embedding
+    cached_answer = await asyncio.to_thread(answer_cache.get, document_id, question, prompt_type, source)
+    question_vector = None
+    cache_info = {
+        "decision"          : "exact",
+        "similarity"        : 1.0,
+        "threshold"         : semantic_answer_cache.threshold,
+        "matched_question"  : question
+    }
+
+    # Fall back to paraphrases of earlier questions on the same document
+    if cached_answer is None:
+        question_vector = await aembed_question(question)
+        
+        similarity = matched_question = None
+        if question_vector is not None:
+            cached_answer, similarity, matched_question = await asyncio.to_thread(
+                semantic_answer_cache.lookup, document_id, prompt_type, source, question_vector
+            )
         
-        if source != "report":
-            for i in range(doc_limit):
-                if looks_like_base64(docs[i]):
-                    images_retrieved['length'] += 1
-                    images_retrieved['content'].append(docs[i])
+        cache_info.update({
+            "decision"          : "semantic" if cached_answer is not None else "miss",
+            "similarity"        : round(similarity, 4) if similarity is not None else None,
+            "matched_question"  : matched_question
+        })
 
-        # Run the default RAG chain
-        llm_response = chain_multimodal_rag.invoke(query)
+    if cached_answer is not None:
+        logger.info(f"FASTAPI Services - alookup_cached_answer() - Answer cache {cache_info['decision']} hit for document {document_id}")
+    else:
+        logger.info(f"FASTAPI Services - alookup_cached_answer() - Answer cache miss for document {document_id}, closest similarity {cache_info['similarity']}")
+
+    return cached_answer, cache_info, question_vector
+
+
+def select_rag_chain(entry, prompt_type, source):
+    """ Pick the retriever for the source and build the matching chain """
+
+    # RAG chains over report_vectorstore or full_text_vectorstore
+    retriever = entry["report_retriever"] if source == "report" else entry["full_text_retriever"]
+
+    if prompt_type == "report":
+        # RAG chain for generating reports
+        return multi_modal_rag_chain(prompt_type="report", max_tokens=2048), retriever
+
+    # Default Q&A RAG chain
+    return multi_modal_rag_chain(prompt_type="default"), retriever
+
+
+def bundle_images(docs, source):
+    """ Collect the images among the top retrieved documents """
+
+    doc_limit = len(docs) if len(docs) < 3 else 3
+    images_retrieved = {
+        "length": 0,
+        "content": []
+    }
+    
+    if source != "report":
+        for doc in docs[:doc_limit]:
+            if isinstance(doc, Document) and doc.metadata.get("type") == "image":
+                images_retrieved['length'] += 1
+                # The client only displays previews, so it gets the thumbnail rendition
+                images_retrieved['content'].append(encode_image(get_rendition_file(doc.metadata["image_file"], "thumbnail")))
+
+    return images_retrieved
+
+
+# Shared CleanLabs TLM client
+# Shared CleanLabs Studio client. TLM clients run their calls on their own event loop,
+# so each thread that scores answers gets its own TLM
+_studio = None
+_studio_lock = threading.Lock()
+_tlm_local = threading.local()
+
+# Background trust scoring runs on its own worker pool, off the response critical path
+trust_score_executor = ThreadPoolExecutor(
+    max_workers         = int(os.getenv("TRUST_SCORE_WORKERS", 8)),
+    thread_name_prefix  = "trust-score"
+)
 
-        # Get trust score from CleanLabs TLM
-        studio = Studio(os.getenv("TLM_API_KEY"))
-        tlm = studio.TLM(
+
+def get_tlm():
+    """ Return the CleanLabs TLM client of the calling thread, built from the process-wide Studio client """
+
+    global _studio
+
+    tlm = getattr(_tlm_local, "tlm", None)
+
+    if tlm is None:
+        with _studio_lock:
+            if _studio is None:
+                _studio = Studio(os.getenv("TLM_API_KEY"))
+
+        tlm = _tlm_local.tlm = _studio.TLM(
             options = {
                 "model" : "gpt-4o"
             }
         )
-        trust_score = tlm.get_trustworthiness_score(prompt=query, response=llm_response)
 
-        # Save and index reports in report_vectorstore only if trust_score exceeds threshold
-        if prompt_type == "report" and trust_score['trustworthiness_score'] > 0.6:
-            save_report_vectorstore(report_vectorstore, llm_response)
-            save_response_to_db(document_id, question, llm_response, token)
+    return tlm
 
-        # Prepare the JSON content to return to frontend
-        response = {
-            "token"         : token,
-            "document_id"   : document_id,
-            "question"      : question,
-            "llm_response"  : llm_response,
-            "image_length"  : images_retrieved['length'],
-            "image_content" : images_retrieved['content'],
-            "trust_score"   : f"{trust_score['trustworthiness_score']:.3f}"
+
+def score_trustworthiness(query, llm_response):
+    """ Get the trust score of a response from CleanLabs TLM """
+
+    return get_tlm().get_trustworthiness_score(prompt=query, response=llm_response)
+
+
+def record_answer(document_id, question, prompt_type, source, token, entry, llm_response, images_retrieved, trust_score, question_vector):
+    """ Index trusted reports and cache the answer, returning the cached fields """
+
+    # Save and index reports in report_vectorstore only if trust_score exceeds threshold
+    if prompt_type == "report" and trust_score['trustworthiness_score'] > 0.6:
+        save_report_vectorstore(entry["report_vectorstore"], llm_response, document_id)
+        save_response_to_db(document_id, question, llm_response, token)
+
+        # The report store changed, so only answers drawn from it may be outdated
+        invalidate_answer_caches(document_id, source = "report")
+
+    cached_answer = {
+        "llm_response"  : llm_response,
+        "image_length"  : images_retrieved['length'],
+        "image_content" : images_retrieved['content'],
+        "trust_score"   : f"{trust_score['trustworthiness_score']:.3f}"
+    }
+    answer_cache.put(document_id, question, prompt_type, source, cached_answer)
+    if question_vector is not None:
+        semantic_answer_cache.put(document_id, prompt_type, source, question, question_vector, cached_answer)
+
+    return cached_answer
+
+
+def complete_trust_scoring(score_id, document_id, question, prompt_type, source, token, entry, llm_response, images_retrieved, question_vector):
+    """ Score an answer, then index and cache it once the score is known """
+
+    try:
+        trust_score = score_trustworthiness(question, llm_response)
+        cached_answer = record_answer(
+            document_id, question, prompt_type, source, token, entry,
+            llm_response, images_retrieved, trust_score, question_vector
+        )
+
+        trust_score_store.put(score_id, document_id, "complete", cached_answer["trust_score"])
+        logger.info(f"FASTAPI Services - complete_trust_scoring() - Scored answer {score_id}")
+        return cached_answer
+
+    except Exception as e:
+        logger.error(f"FASTAPI Services Error - complete_trust_scoring() encountered an error: {e}")
+        trust_score_store.put(score_id, document_id, "failed")
+        raise
+
+
+def submit_trust_scoring(document_id, question, prompt_type, source, token, entry, llm_response, images_retrieved, question_vector):
+    """ Queue the trust scoring of an answer, returning its score id """
+
+    score_id = str(uuid.uuid4())
+    trust_score_store.put(score_id, document_id, "pending")
+
+    trust_score_executor.submit(
+        complete_trust_scoring,
+        score_id, document_id, question, prompt_type, source, token, entry,
+        llm_response, images_retrieved, question_vector
+    )
+
+    return score_id
+
+
+def scoring_in_background():
+    """ Whether answers are returned before their trust score is known """
+
+    return os.getenv("TRUST_SCORE_MODE", "sync") == "background"
+
+
+def pending_answer(llm_response, images_retrieved, score_id):
+    """ Answer fields returned while the trust score is still being computed """
+
+    return {
+        "llm_response"  : llm_response,
+        "image_length"  : images_retrieved['length'],
+        "image_content" : images_retrieved['content'],
+        "trust_score"   : "pending",
+        "score_id"      : score_id
+    }
+
+
+def get_trust_score(score_id):
+    """ Report the status of a background trust scoring job """
+
+    logger.info(f"FASTAPI Services - get_trust_score() - Fetching trust score {score_id}")
+
+    result = trust_score_store.get(score_id)
+
+    if result is None:
+        return JSONResponse({
+            'status'    : status.HTTP_404_NOT_FOUND,
+            'type'      : 'string',
+            'message'   : f"No trust score found for score_id {score_id}"
+        })
+
+    return JSONResponse({
+        'status'    : status.HTTP_200_OK,
+        'type'      : 'json',
+        'message'   : {
+            "score_id"  : score_id,
+            **result
         }
+    })
+
+
+def format_sse(event, data):
+    """ Format a server-sent event with a JSON payload """
+
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def ainvoke_pipeline(document_id, question, prompt_type, source, token):
+    """ Async RAG pipeline, network calls are awaited and blocking work runs on worker threads """
+
+    logger.info(f"FASTAPI Services - ainvoke_pipeline() - Initiating RAG pipeline")
+
+    cached_answer, cache_info, question_vector = await alookup_cached_answer(document_id, question, prompt_type, source)
+    
+    if cached_answer is not None:
+        return JSONResponse({
+            'status'    : status.HTTP_200_OK,
+            'type'      : 'json',
+            'message'   : {
+                "token"         : token,
+                "document_id"   : document_id,
+                "question"      : question,
+                **cached_answer,
+                "cache"         : cache_info
+            }
+        })
+
+    # Documents that are not ingested yet are handed to the ingestion queue
+    try:
+        job = await asyncio.to_thread(pending_ingestion_job, document_id)
+    
+    except IngestionQueueFull:
+        return JSONResponse({
+            'status'    : status.HTTP_503_SERVICE_UNAVAILABLE,
+            'type'      : 'string',
+            'message'   : 'The ingestion queue is full. Please retry later.'
+        })
+
+    if job is not None:
+        return indexing_response(document_id, job)
+
+    # Building the retrievers may run the whole ingestion on a miss
+    try:
+        entry = await asyncio.to_thread(get_document_retrievers, document_id)
+    
+    except DocumentBuildInProgress:
+        return indexing_response(document_id)
+
+    except Exception as e:
+        logger.error(f"FASTAPI Services Error - ainvoke_pipeline() could not build the retrievers: {e}")
+        return JSONResponse({
+            'status'    : status.HTTP_500_INTERNAL_SERVER_ERROR,
+            'type'      : 'string',
+            'message'   : 'Error while building the document index'
+        })
+
+    try:
+
+        chain_multimodal_rag, retriever = select_rag_chain(entry, prompt_type, source)
+        docs = await retriever.ainvoke(question)
+        
+        # Bundle the images
+        images_retrieved = await asyncio.to_thread(bundle_images, docs, source)
+
+        # Run the default RAG chain
+        llm_response = await chain_multimodal_rag.ainvoke({"docs": docs, "question": question})
+
+        # Get trust score from CleanLabs TLM, reports are indexed once it arrives
+        if scoring_in_background():
+            score_id = submit_trust_scoring(
+                document_id, question, prompt_type, source, token, entry,
+                llm_response, images_retrieved, question_vector
+            )
+            cached_answer = pending_answer(llm_response, images_retrieved, score_id)
+        
+        # Inline scoring gets its own thread, so it is not capped by the background pool
+        else:
+            score_id = str(uuid.uuid4())
+            cached_answer = await asyncio.to_thread(
+                complete_trust_scoring,
+                score_id, document_id, question, prompt_type, source, token, entry,
+                llm_response, images_retrieved, question_vector
+            )
+            cached_answer = {**cached_answer, "score_id": score_id}
 
         return JSONResponse({
             'status'    : status.HTTP_200_OK,
             'type'      : 'json',
-            'message'   : response
+            'message'   : {
+                "token"         : token,
+                "document_id"   : document_id,
+                "question"      : question,
+                **cached_answer,
+                "cache"         : cache_info
+            }
         })
     
     except Exception as e:
-        logger.error(f"FASTAPI Services Erorr - invoke_pipeline() encountered an error: {e}")
+        logger.error(f"FASTAPI Services Error - ainvoke_pipeline() encountered an error: {e}")
         return JSONResponse({
             'status'    : status.HTTP_500_INTERNAL_SERVER_ERROR,
             'type'      : 'string',
             'message'   : 'Error while implementing RAG pipeline'
-        })
\ No newline at end of file
+        })
+
+
+async def astream_pipeline(document_id, question, prompt_type, source, token):
+    """ Stream the RAG answer as server-sent events: images, tokens, then the trust score """
+
+    logger.info(f"FASTAPI Services - astream_pipeline() - Initiating streaming RAG pipeline")
+
+    try:
+        cached_answer, cache_info, question_vector = await alookup_cached_answer(document_id, question, prompt_type, source)
+
+        if cached_answer is not None:
+            yield format_sse("images", {
+                "image_length"  : cached_answer["image_length"],
+                "image_content" : cached_answer["image_content"]
+            })
+            yield format_sse("token", {"content": cached_answer["llm_response"]})
+            yield format_sse("trust_score", {"trust_score": cached_answer["trust_score"], "cache": cache_info})
+            yield format_sse("done", {"document_id": document_id})
+            return
+
+        # Documents that are not ingested yet are handed to the ingestion queue
+        job = await asyncio.to_thread(pending_ingestion_job, document_id)
+        if job is not None:
+            yield format_sse("indexing", {"document_id": document_id, "job": job})
+            return
+
+        entry = await asyncio.to_thread(get_document_retrievers, document_id)
+        chain_multimodal_rag, retriever = select_rag_chain(entry, prompt_type, source)
+        docs = await retriever.ainvoke(question)
+
+        # Images are known as soon as retrieval is done, send them before the answer
+        images_retrieved = await asyncio.to_thread(bundle_images, docs, source)
+        yield format_sse("images", {
+            "image_length"  : images_retrieved['length'],
+            "image_content" : images_retrieved['content']
+        })
+
+        # Push tokens to the client as the model produces them
+        chunks = []
+        async for chunk in chain_multimodal_rag.astream({"docs": docs, "question": question}):
+            chunks.append(chunk)
+            yield format_sse("token", {"content": chunk})
+
+        llm_response = "".join(chunks)
+
+        # Score the complete answer and send it as the trailer
+        score_id = str(uuid.uuid4())
+        cached_answer = await asyncio.to_thread(
+            complete_trust_scoring,
+            score_id, document_id, question, prompt_type, source, token, entry,
+            llm_response, images_retrieved, question_vector
+        )
+
+        yield format_sse("trust_score", {"trust_score": cached_answer["trust_score"], "score_id": score_id, "cache": cache_info})
+        yield format_sse("done", {"document_id": document_id})
+
+    except DocumentBuildInProgress:
+        yield format_sse("indexing", {"document_id": document_id, "job": None})
+
+    except IngestionQueueFull:
+        yield format_sse("error", {
+            'status'    : status.HTTP_503_SERVICE_UNAVAILABLE,
+            'message'   : 'The ingestion queue is full. Please retry later.'
+        })
+
+    except Exception as e:
+        logger.error(f"FASTAPI Services Error - astream_pipeline() encountered an error: {e}")
+        yield format_sse("error", {
+            'status'    : status.HTTP_500_INTERNAL_SERVER_ERROR,
+            'message'   : 'Error while implementing RAG pipeline'
+        })
@@ -110,6 +110,9 @@ def display_qa_interface():
             # FIXED: Append assistant message with any images to session state to avoid losing images on refresh
             st.session_state.messages.append(assistant_message)
                 
+        elif response.status_code == HTTPStatus.ACCEPTED:
+            st.info("This document is still being indexed. Please ask again in a few minutes.")
+
         else:
             st.error("Error fetching response. Please try again.")
 